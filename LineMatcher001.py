@@ -32,42 +32,603 @@ Expected Output:
     {'Another log entry': ''}
     {'No matching substring': ''}
 
+Usage:
+    python LineMatcher001.py                      # reads "input_file_name.log"
+    python LineMatcher001.py app.log
+    tail -f app.log | python LineMatcher001.py - --stream
+    python LineMatcher001.py app.log --stream --found-output found.log --not-found-output not_found.log
+
+With --stream every result is emitted as soon as it is known, in the format of the result dictionary,
+and memory use does not grow with the size of the input.
+
+Interleaved logs (e.g. several threads writing at once) often put the continuation of a line several lines
+later. --window N checks each line against the next N lines instead of only the next one, and --whole-file
+against every later line. A line found in a later line consumes it, just like the default mode consumes the
+next line, and results are still reported in input order. --window 1 gives the same results as the default.
+    python LineMatcher001.py app.log --window 20
+    python LineMatcher001.py app.log --whole-file
+
+--stats prints the time spent reading, matching and writing the results to stderr at the end, and
+--profile profiles the run with cProfile or tracemalloc (see common.instrumentation).
+    python LineMatcher001.py app.log --stream --stats > results.txt
+
+Several inputs, directories (walked recursively) and glob patterns can be given. Each file is matched on its
+own and the results are reported in input order. With more than one file, or a file larger than
+--shard-size MB, the work is spread over --workers processes, and large files are split into shards of whole
+lines matched in parallel. The pair of lines spanning a shard boundary is reconciled, so the results are
+exactly those of a sequential run. With --window or --whole-file, files are not split.
+    python LineMatcher001.py logs/ "archive/**/*.log" --workers 8
+    python LineMatcher001.py huge.log --shard-size 32 --stream > results.txt
+
+--summary replaces the per-line output with one row per message template: numbers, IPs, hex strings, UUIDs
+and quoted values are masked (e.g. "Timeout after <NUM>ms on <IP>"), and the found and not found lines of
+every template are counted. At most --summary-size templates are kept in memory: when a new template
+arrives at a full table, the least frequent one is evicted (the Space-Saving algorithm), so the frequent
+templates are always counted, with an error bound reported for each. --summary-format json emits the same
+summary as JSON.
+    python LineMatcher001.py logs/ --summary --top 20
+    python LineMatcher001.py app.log --summary --summary-format json > summary.json
+
+The encoding of the input file is detected (see common.io_extender.detect_encoding), so logs that are not
+valid UTF-8 are read instead of failing.
+
 Functions:
     - read_file_to_lines(file_name, folder_path): Reads the content of a file and returns it as a list of lines.
     - remove_empty_lines(lines): Removes any empty lines from a list of lines.
+    - iter_file_lines(file_name, folder_path): Lazily yields the lines of a file, or of stdin for "-".
+    - iter_non_empty_lines(lines): Lazily drops empty lines.
+    The four functions above come from common.io_extender.
+    - match_lines(lines): Compares each line with the next one and yields (line, found) results.
+    - match_lines_windowed(lines, window): Compares each line with the next `window` lines, or all later lines.
+    - list_match_jobs(inputs, shard_size, split): Expands the inputs into files and shards to match.
+    - match_shard(job): Matches one file or shard in a worker process.
+    - merge_shard_results(shard_results): Reconciles the shard boundaries and yields the results in input order.
+    - line_template(line): Masks the variable parts of a line.
+    - summarize_results(results, max_templates): Counts the found and not found lines of every template.
 """
 
 import os
+import re
+import sys
+import json
+import argparse
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from common.instrumentation import RunStats, add_instrumentation_arguments, profiled
+from common.io_extender import (DEFAULT_SHARD_SIZE, detect_encoding, iter_file_lines, iter_file_range_lines,
+                                iter_non_empty_lines, list_input_files, split_file_ranges)
+
+# Length of the substring of a pending line used as its key in the PendingIndex
+ANCHOR_LENGTH = 8
+# Below this number of distinct pending lines, checking each of them directly is faster than the index
+INDEX_THRESHOLD = 16
+# Default number of templates counted by --summary, and shown by its report
+SUMMARY_SIZE = 10000
+SUMMARY_TOP = 50
+
+# Variable parts of log lines masked by line_template, tried in this order at every position: quoted values
+# first, so that what they contain is masked as a whole, then IPs, UUIDs and hex strings (with at least a
+# letter and a digit, or 0x), before the numbers they would otherwise be cut into
+TEMPLATE_PATTERN = re.compile(
+    r'(?P<STR>"[^"]*"|(?<![A-Za-z0-9])\'[^\']*\'(?![A-Za-z0-9]))'
+    r'|(?P<IP>\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b)'
+    r'|(?P<UUID>\b[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}\b)'
+    r'|(?P<HEX>\b0[xX][0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*[a-fA-F])(?=[0-9a-fA-F]*[0-9])[0-9a-fA-F]{8,}\b)'
+    r'|(?P<NUM>[0-9]+(?:\.[0-9]+)*)'
+)
+
+class PendingIndex:
+    """
+    Index of the lines still waiting for their continuation, answering "which is the oldest pending line
+    contained in this line?" in time proportional to the length of the line rather than to the number of
+    pending lines. Every pending text is keyed by one of its ANCHOR_LENGTH-character substrings (the whole
+    text if it is shorter), picking the one shared by the fewest other pending texts so that the common
+    prefixes of log lines (timestamps, thread names) do not pile up in one bucket. Each anchor-sized slice of
+    an incoming line is looked up, and candidates are verified in place.
+    """
+
+    def __init__(self):
+        self.ids_by_text = {}         # pending text -> deque of pending line ids, oldest first
+        self.anchor_of = {}           # pending text -> (anchor, offset of the anchor in the text)
+        self.texts_by_anchor = {}     # anchor length -> {anchor: set of pending texts}
+
+    def __len__(self):
+        return len(self.ids_by_text)
+
+    def add(self, text, line_id):
+        """Adds a pending line."""
+        ids = self.ids_by_text.get(text)
+        if ids is None:
+            ids = self.ids_by_text[text] = deque()
+            anchor, offset = self._choose_anchor(text)
+            self.anchor_of[text] = (anchor, offset)
+            self.texts_by_anchor.setdefault(len(anchor), {}).setdefault(anchor, set()).add(text)
+        ids.append(line_id)
+
+    def remove_oldest(self, text):
+        """Removes and returns the id of the oldest pending line with this text."""
+        ids = self.ids_by_text[text]
+        line_id = ids.popleft()
+        if not ids:
+            del self.ids_by_text[text]
+            anchor, _ = self.anchor_of.pop(text)
+            anchors = self.texts_by_anchor[len(anchor)]
+            anchors[anchor].discard(text)
+            if not anchors[anchor]:
+                del anchors[anchor]
+                if not anchors:
+                    del self.texts_by_anchor[len(anchor)]
+        return line_id
+
+    def find_oldest_contained(self, line):
+        """Returns the text of the oldest pending line that is a substring of line, or None."""
+        best_text, best_id = None, None
+        if len(self.ids_by_text) < INDEX_THRESHOLD:
+            candidates = (text for text in self.ids_by_text if text in line)
+        else:
+            candidates = self._indexed_candidates(line)
+        for text in candidates:
+            line_id = self.ids_by_text[text][0]
+            if best_id is None or line_id < best_id:
+                best_text, best_id = text, line_id
+        return best_text
+
+    def _choose_anchor(self, text):
+        """Returns the (anchor, offset) of text whose anchor bucket currently holds the fewest texts."""
+        if len(text) <= ANCHOR_LENGTH:
+            return text, 0
+        anchors = self.texts_by_anchor.get(ANCHOR_LENGTH, {})
+        best_offset, best_size = 0, None
+        for offset in range(len(text) - ANCHOR_LENGTH + 1):
+            size = len(anchors.get(text[offset:offset + ANCHOR_LENGTH], ()))
+            if best_size is None or size < best_size:
+                best_offset, best_size = offset, size
+                if size == 0:
+                    break
+        return text[best_offset:best_offset + ANCHOR_LENGTH], best_offset
+
+    def _indexed_candidates(self, line):
+        """Yields the distinct pending texts contained in line, found through their anchors."""
+        seen = set()
+        for length, anchors in self.texts_by_anchor.items():
+            for pos in range(len(line) - length + 1):
+                texts = anchors.get(line[pos:pos + length])
+                if not texts:
+                    continue
+                for text in texts:
+                    offset = self.anchor_of[text][1]
+                    if text not in seen and pos >= offset and line.startswith(text, pos - offset):
+                        seen.add(text)
+                        yield text
+
+class TemplateCounter:
+    """
+    Counts the found and not found lines of every template in bounded memory with the Space-Saving algorithm.
+    At most max_templates templates are kept. When a new template arrives at a full table, one of the least
+    counted templates is evicted and the new one takes over its count plus one, recording that count as its
+    error. Any template occurring more than (lines counted / max_templates) times is therefore always kept,
+    its count is at most error above the truth, and its found and not found counts are exact since it was
+    last added. Templates are grouped in buckets by count, so adding and evicting take constant time.
+    """
+
+    def __init__(self, max_templates=SUMMARY_SIZE):
+        """:param max_templates: The maximum number of templates kept."""
+        if max_templates < 1:
+            raise ValueError("max_templates must be at least 1")
+        self.max_templates = max_templates
+        self.entries = {}      # template -> [count, found, not found, error]
+        self.buckets = {}      # count -> {template: None}, in insertion order
+        self.min_count = 0     # smallest count of a kept template
+        self.lines = 0
+        self.found = 0
+        self.evictions = 0
+
+    def add(self, template, found):
+        """Counts one found or not found line of a template."""
+        self.lines += 1
+        if found:
+            self.found += 1
+        entry = self.entries.get(template)
+        if entry is None:
+            if len(self.entries) < self.max_templates:
+                entry = self.entries[template] = [0, 0, 0, 0]
+            else:
+                # take over the count of a least counted template, as an upper bound of the evicted occurrences
+                bucket = self.buckets[self.min_count]
+                evicted = next(iter(bucket))
+                self._remove_from_bucket(evicted, self.min_count)
+                del self.entries[evicted]
+                self.evictions += 1
+                entry = self.entries[template] = [self.min_count, 0, 0, self.min_count]
+        else:
+            self._remove_from_bucket(template, entry[0])
+        entry[0] += 1
+        entry[1 if found else 2] += 1
+        self.buckets.setdefault(entry[0], {})[template] = None
+        if entry[0] == 1:
+            self.min_count = 1
+        elif entry[0] - 1 == self.min_count and self.min_count not in self.buckets:
+            # the template was the last one of the least counted bucket, the next count up is now the least
+            self.min_count = entry[0]
+
+    def _remove_from_bucket(self, template, count):
+        """Removes a template from the bucket of its count, dropping the bucket once empty."""
+        bucket = self.buckets[count]
+        del bucket[template]
+        if not bucket:
+            del self.buckets[count]
+
+    def top(self, count=None):
+        """
+        Returns the most counted templates.
+
+        :param count: The number of templates to return, all kept templates if None.
+        :return: A list of (template, count, found, not found, error), most counted first.
+        """
+        ranked = sorted(self.entries.items(), key=lambda item: -item[1][0])
+        return [(template, *entry) for template, entry in ranked[:count]]
 
 def main():
-    # Read lines from the specified log file
-    reading_lines = read_file_to_lines("input_file_name.log") # change the file name and 
-            ## add the path to file as second argument if the file is not in same location of the file script
+    parser = argparse.ArgumentParser(description="Check whether each line of a log is a substring of the next line.")
+    parser.add_argument("inputs", nargs="*", default=["input_file_name.log"],
+                        help='Log files, directories or glob patterns to read, or "-" for stdin '
+                             '(default: input_file_name.log).')
+    parser.add_argument("--stream", action="store_true",
+                        help="Emit every result as soon as it is known instead of printing grouped lists at the end.")
+    parser.add_argument("--found-output", help="With --stream, also append found lines to this file.")
+    parser.add_argument("--not-found-output", help="With --stream, also append not found lines to this file.")
+    parser.add_argument("--summary", action="store_true",
+                        help="Print the found and not found counts of every line template instead of every line.")
+    parser.add_argument("--summary-size", type=int, default=SUMMARY_SIZE,
+                        help=f"Maximum number of templates counted by --summary (default: {SUMMARY_SIZE}).")
+    parser.add_argument("--summary-format", choices=["text", "json"], default="text",
+                        help="Format of the --summary report (default: text).")
+    parser.add_argument("--top", type=int, default=SUMMARY_TOP,
+                        help=f"Number of templates shown by --summary, 0 for all (default: {SUMMARY_TOP}).")
+    window_group = parser.add_mutually_exclusive_group()
+    window_group.add_argument("--window", type=int, help="Check each line against the next N lines.")
+    window_group.add_argument("--whole-file", action="store_true", help="Check each line against every later line.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of processes matching files and shards in parallel (default: number of CPUs).")
+    parser.add_argument("--shard-size", type=float, default=DEFAULT_SHARD_SIZE / (1024 * 1024),
+                        help="Files larger than this many MB are split into shards matched in parallel "
+                             f"(default: {DEFAULT_SHARD_SIZE // (1024 * 1024)}).")
+    add_instrumentation_arguments(parser, quiet=False)
+    args = parser.parse_args()
+
+    if args.window is not None and args.window < 1:
+        parser.error("--window must be at least 1")
+    if args.workers < 1 or args.shard_size <= 0:
+        parser.error("--workers and --shard-size must be positive")
+    if args.summary_size < 1 or args.top < 0:
+        parser.error("--summary-size must be positive and --top at least 0")
+    if args.summary and args.stream:
+        parser.error("--summary and --stream cannot be combined")
+    if "-" in args.inputs and len(args.inputs) > 1:
+        parser.error('stdin ("-") cannot be combined with other inputs')
+    # --whole-file is a window of None, so whether a window is used is kept apart from its size
+    windowed = bool(args.window) or args.whole_file
+    try:
+        jobs = list_match_jobs(args.inputs, int(args.shard_size * 1024 * 1024), split=not windowed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Lines are only timed when asked for, as timing every line has a cost
+    stats = RunStats(unit="lines", timed=args.stats)
+    if args.workers > 1 and len(jobs) > 1:
+        # files and shards are read and matched in the workers, their time shows up as the match stage
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            shard_results = executor.map(match_shard, [job + (windowed, args.window) for job in jobs])
+            results = stats.timed_iter("match", merge_shard_results(shard_results))
+            write_match_results(args, results, stats)
+    else:
+        # Read the non-empty lines of every log lazily and compare each line with the next one(s)
+        results = itertools.chain.from_iterable(
+            iter_file_matches(stats.timed_iter("read", iter_non_empty_lines(iter_file_lines(path, encoding=encoding)),
+                                               len), windowed, args.window)
+            for path, encoding, _, _ in iter_whole_files(jobs))
+        write_match_results(args, stats.timed_iter("match", results), stats)
 
-    # Remove any empty lines from the list of lines
-    filtered_lines = remove_empty_lines(reading_lines)
+    if args.stats:
+        # lines are counted by the read stage rather than one progress() call each, to keep the loop cheap
+        stats.processed = stats.stages.get("read", stats.stages.get("match", (0, 0, 0)))[1]
+        print(stats.report(), file=sys.stderr)
 
+def write_match_results(args, results, stats):
+    """Prints the results, streamed, grouped or summarized, and writes the optional found and not found files."""
+    with profiled(args.profile, args.profile_output):
+        # reading and matching happen lazily while the results are written, and are timed as their own stages
+        with stats.stage("write"):
+            if args.summary:
+                counter = summarize_results(results, args.summary_size)
+                if args.summary_format == "json":
+                    print(json.dumps(summary_to_dict(counter, args.top or None), indent=2))
+                else:
+                    print(format_summary(counter, args.top or None))
+            elif args.stream:
+                stream_results(results, args.found_output, args.not_found_output)
+            else:
+                print_results(results)
+
+def match_lines(lines):
+    """
+    Compares each line with the next one using a two-line sliding window and yields (stripped line, found)
+    for every line checked. When a line is found in the next one, the pair is consumed and the window moves
+    past both lines. The last line is never checked, as there is no next line to compare it with.
+    """
+    pending = None
+    for line in lines:
+        if pending is None:
+            pending = line
+            continue
+
+        # Check if the pending line is a substring of the next line
+        if pending.strip() in line:
+            yield pending.strip(), True
+            # Skip to the next pair of lines
+            pending = None
+        else:
+            yield pending.strip(), False
+            # Move to the next line
+            pending = line
+
+def match_lines_windowed(lines, window=None):
+    """
+    Compares each line with the next `window` lines (every later line if window is None) and yields
+    (stripped line, found) in input order. Each incoming line is first checked as the continuation of the
+    pending lines: if it contains one, the oldest such line is found and the incoming line is consumed.
+    Otherwise it becomes pending itself. Lookups go through a PendingIndex, so the cost stays near-linear in
+    the input size even for large windows. As in match_lines, the last line is not reported if it was never
+    compared with a later line, so window=1 gives exactly the results of match_lines.
+    """
+    index = PendingIndex()
+    pending = OrderedDict()   # pending line id -> (position, stripped text), oldest first
+    results = {}              # line id -> (stripped text, found), None if the line is not reported
+    next_id = next_emit = 0
+    position = -1
+
+    for position, line in enumerate(lines):
+        text = index.find_oldest_contained(line)
+        if text is not None:
+            line_id = index.remove_oldest(text)
+            del pending[line_id]
+            results[line_id] = (text, True)
+        else:
+            stripped = line.strip()
+            pending[next_id] = (position, stripped)
+            index.add(stripped, next_id)
+            next_id += 1
+
+        # Pending lines whose whole window has been seen are not found
+        while window is not None and pending:
+            line_id, (start, stripped) = next(iter(pending.items()))
+            if start + window > position:
+                break
+            pending.popitem(last=False)
+            index.remove_oldest(stripped)
+            results[line_id] = (stripped, False)
+
+        # Report results in input order as soon as all earlier lines are settled
+        while next_emit in results:
+            yield results.pop(next_emit)
+            next_emit += 1
+
+    # At the end of input, pending lines are not found, except a last line that was never compared
+    for line_id, (start, stripped) in pending.items():
+        results[line_id] = (stripped, False) if start < position else None
+    while next_emit in results:
+        result = results.pop(next_emit)
+        if result is not None:
+            yield result
+        next_emit += 1
+
+def iter_file_matches(lines, windowed=False, window=None):
+    """Yields the results of one file: match_lines, or match_lines_windowed with window if windowed is set."""
+    if not windowed:
+        return match_lines(lines)
+    return match_lines_windowed(lines, window)
+
+def list_match_jobs(inputs, shard_size=DEFAULT_SHARD_SIZE, split=True):
+    """
+    Expands the inputs into the list of files to match, in input order, each file split into shards of about
+    shard_size bytes of whole lines if split is set. The encoding of every file is detected once here.
+
+    :param inputs: Files, directories and glob patterns, or ["-"] for stdin.
+    :param shard_size: The approximate size of the shards in bytes.
+    :param split: Whether files may be split. Files in an encoding where a newline is not a single byte
+                  (UTF-16, UTF-32) are never split.
+    :return: The list of (path, encoding, start, end) jobs; start and end are None for stdin.
+    """
+    if inputs == ["-"]:
+        return [("-", None, None, None)]
+    jobs = []
+    seen = set()
+    for input_path in inputs:
+        files = list_input_files(input_path)
+        if not files:
+            raise ValueError(f"No input file matches '{input_path}'")
+        for path in files:
+            if path in seen:
+                continue
+            seen.add(path)
+            encoding = detect_encoding(path)
+            if split and not encoding.startswith(("utf-16", "utf-32")):
+                ranges = split_file_ranges(path, shard_size)
+            else:
+                ranges = [(0, os.path.getsize(path))]
+            jobs.extend((path, encoding, start, end) for start, end in ranges)
+    return jobs
+
+def iter_whole_files(jobs):
+    """Yields the jobs starting at the beginning of a file, one per file (the in-process path reads whole files)."""
+    return (job for job in jobs if not job[2])
+
+def match_shard(job):
+    """
+    Matches one file or shard in a worker process. A shard other than the first of its file is matched twice
+    with match_lines, as the sequential run would see it: once with its first line starting a pair, once with
+    its first line consumed by the last line of the previous shard. The second pass stops as soon as both
+    passes reach the same state, from where they are identical, so it is usually only a few lines long.
+
+    :param job: (path, encoding, start, end, windowed, window), see list_match_jobs; windowed selects
+                match_lines_windowed with window (None for every later line) instead of match_lines.
+    :return: (first shard of its file, first line, results, line left pending at the end, results and
+             pending line if the first line is consumed), results being lists of (stripped line, found).
+    """
+    path, encoding, start, end, windowed, window = job
+    lines = list(iter_non_empty_lines(iter_file_range_lines(path, start, end, encoding)))
+    first_line = lines[0] if lines else None
+    if windowed:
+        # files are not split with a window, the whole file is the shard
+        return True, first_line, list(match_lines_windowed(lines, window)), None, None, None
+
+    steps = list(iter_match_steps(lines))
+    results = [result for _, _, result in steps if result is not None]
+    pending = steps[-1][1] if steps else None
+    if start == 0:
+        return True, first_line, results, lines[pending] if pending is not None else None, None, None
+
+    consumed_results, consumed_pending = [], None
+    for index, consumed_pending, result in iter_match_steps(lines, 1):
+        if result is not None:
+            consumed_results.append(result)
+        if consumed_pending == steps[index][1]:
+            # same state after the same line: the rest of the shard gives the results of the first pass
+            consumed_results.extend(result for _, _, result in steps[index + 1:] if result is not None)
+            consumed_pending = pending
+            break
+    return (False, first_line, results, lines[pending] if pending is not None else None, consumed_results,
+            lines[consumed_pending] if consumed_pending is not None else None)
+
+def iter_match_steps(lines, start=0):
+    """
+    Runs match_lines over lines[start:] and yields its state after every line: (index of the line, index of
+    the line left pending or None, result reported at this line or None).
+    """
+    pending = None
+    for index in range(start, len(lines)):
+        result = None
+        if pending is None:
+            pending = index
+        else:
+            # Check if the pending line is a substring of the next line
+            text = lines[pending].strip()
+            if text in lines[index]:
+                result, pending = (text, True), None
+            else:
+                result, pending = (text, False), index
+        yield index, pending, result
+
+def merge_shard_results(shard_results):
+    """
+    Yields the results of match_shard, in input order, as one sequential match_lines run per file would:
+    the line left pending at the end of a shard is compared with the first line of the next shard, and when
+    it is found there, the results of the next shard with its first line consumed are used.
+
+    :param shard_results: The results of match_shard for every job, in input order.
+    """
+    carry = None
+    for first, first_line, results, pending, consumed_results, consumed_pending in shard_results:
+        if first:
+            # the line left pending at the end of a file is never compared, as in match_lines
+            carry = None
+        elif carry is not None and first_line is not None:
+            text = carry.strip()
+            if text in first_line:
+                yield text, True
+                results, pending = consumed_results, consumed_pending
+            else:
+                yield text, False
+        yield from results
+        if first_line is not None:
+            carry = pending
+
+def stream_results(results, found_output=None, not_found_output=None):
+    """Prints every result as a one-entry dict as soon as it is known, optionally splitting them into two files."""
+    found_file = open(found_output, "a") if found_output else None
+    not_found_file = open(not_found_output, "a") if not_found_output else None
+    try:
+        for line, found in results:
+            print({line: 'Found' if found else ''}, flush=True)
+            target = found_file if found else not_found_file
+            if target:
+                target.write(line + "\n")
+                target.flush()
+    finally:
+        for f in (found_file, not_found_file):
+            if f:
+                f.close()
+
+def line_template(line):
+    """
+    Returns the template of a line: the line with its quoted values, IPs, UUIDs, hex strings and numbers
+    replaced by <STR>, <IP>, <UUID>, <HEX> and <NUM>, so that the occurrences of one message share a template.
+    """
+    return TEMPLATE_PATTERN.sub(lambda match: f"<{match.lastgroup}>", line)
+
+def summarize_results(results, max_templates=SUMMARY_SIZE):
+    """
+    Counts the found and not found lines of every template.
+
+    :param results: (stripped line, found) results, e.g. of match_lines.
+    :param max_templates: The maximum number of templates kept in memory, see TemplateCounter.
+    :return: The TemplateCounter.
+    """
+    counter = TemplateCounter(max_templates)
+    # templates repeat a lot, so the masking of identical lines is cached; the cache is bounded like the counter
+    templates = {}
+    for line, found in results:
+        template = templates.get(line)
+        if template is None:
+            if len(templates) >= max_templates:
+                templates.clear()
+            template = templates[line] = line_template(line)
+        counter.add(template, found)
+    return counter
+
+def summary_to_dict(counter, top=None):
+    """Returns the summary of a TemplateCounter as a dict, with its top templates, ready for JSON."""
+    return {
+        "lines": counter.lines,
+        "found": counter.found,
+        "not_found": counter.lines - counter.found,
+        "max_templates": counter.max_templates,
+        "templates_kept": len(counter.entries),
+        "evictions": counter.evictions,
+        "templates": [{"template": template, "count": count, "found": found, "not_found": not_found, "error": error}
+                      for template, count, found, not_found, error in counter.top(top)],
+    }
+
+def format_summary(counter, top=None):
+    """Returns the summary of a TemplateCounter as a table of its top templates."""
+    lines = [f"{counter.lines} lines: {counter.found} found, {counter.lines - counter.found} not found, "
+             f"{len(counter.entries)} templates kept"]
+    if counter.evictions:
+        lines.append(f"{counter.evictions} templates evicted from a table of {counter.max_templates}: counts are "
+                     f"upper bounds, at most 'error' above the truth")
+    lines.append(f"{'count':>10} {'found':>10} {'not found':>10} {'error':>8}  template")
+    for template, count, found, not_found, error in counter.top(top):
+        lines.append(f"{count:>10} {found:>10} {not_found:>10} {error:>8}  {template}")
+    return "\n".join(lines)
+
+def print_results(results):
+    """Collects all results and prints the found lines, the not found lines and the result dictionary."""
     # Initialize lists to store found and not found lines, and a result dictionary to store the results
     found_list = []
     not_found_list = []
     result_dict = []
-    i = 0
-
-    # Iterate through the filtered lines
-    while i < len(filtered_lines)-1:
-        # Check if the current line is a substring of the next line
-        if filtered_lines[i].strip() in filtered_lines[i+1]:
-            # If found, add the current line to the found_list and result_dict with 'Found' status
-            found_list.append(filtered_lines[i].strip())
-            result_dict.append({filtered_lines[i].strip(): 'Found'})
-            # Skip to the next pair of lines
-            i = i + 2
+
+    for line, found in results:
+        if found:
+            # If found, add the line to the found_list and result_dict with 'Found' status
+            found_list.append(line)
+            result_dict.append({line: 'Found'})
         else:
-            # If not found, add the current line to the not_found_list and result_dict with an empty status
-            not_found_list.append(filtered_lines[i].strip())
-            result_dict.append({filtered_lines[i].strip(): ''})
-            # Move to the next line
-            i = i + 1
+            # If not found, add the line to the not_found_list and result_dict with an empty status
+            not_found_list.append(line)
+            result_dict.append({line: ''})
     
     # Print all lines that were found
     print("Found String")
@@ -83,18 +644,7 @@ def main():
     print("String As Dict")
     [print(line) for line in result_dict]
         
-def read_file_to_lines(file_name, folder_path = ''):
-    """ Read file and return it in list of lines """
-    file_path = os.path.join(folder_path, file_name) if folder_path else file_name
-    file_obj = open(file_path, "r")
-    lines = file_obj.readlines()
-    file_obj.close()
-    return lines
-
-def remove_empty_lines(lines):
-    """Remove empty lines from a list of lines."""
-    return [line for line in lines if line.strip() ]
-
 
-main()
+if __name__ == "__main__":
+    main()
 
@@ -0,0 +1,95 @@
+"""
+Benchmark for encrypt_file_content.decrypt_content, showing how decryption time scales with file size.
+
+A synthetic encrypted log and its mappings.csv are generated directly (word_XXXX tokens, replacement
+IPs and ports), so the number of mappings can be tuned independently of the file size. Only the
+decryption is timed. If decryption is linear in the file size the reported MB/s stays roughly
+constant as the size doubles, no matter how many mappings there are.
+
+Usage:
+    python benchmarks/bench_decrypt.py
+    python benchmarks/bench_decrypt.py --base-lines 20000 --steps 5 --mappings 8000
+"""
+
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import encrypt_file_content
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decrypt_content across growing file sizes.")
+    parser.add_argument("--base-lines", type=int, default=10000, help="Number of lines of the smallest file.")
+    parser.add_argument("--steps", type=int, default=4, help="Number of times the file size is doubled.")
+    parser.add_argument("--mappings", type=int, default=8000, help="Number of word, IP and port mappings each.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic log generator.")
+    args = parser.parse_args()
+
+    print(f"{'lines':>10} {'MB':>8} {'mappings':>10} {'seconds':>9} {'MB/s':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        mappings_file = os.path.join(tmp_dir, "mappings.csv")
+        mappings = generate_mappings(args.mappings, args.seed)
+        write_mappings(mappings, mappings_file)
+
+        for step in range(args.steps):
+            line_count = args.base_lines * (2 ** step)
+            size_mb, seconds = run_once(tmp_dir, mappings, mappings_file, line_count, args.seed)
+            print(f"{line_count:>10} {size_mb:>8.2f} {3 * args.mappings:>10} {seconds:>9.3f} {size_mb / seconds:>8.2f}")
+
+def generate_mappings(count, seed=0):
+    """Generates count unique word, IP and port mappings as (original, replacement, type) tuples."""
+    rng = random.Random(seed)
+    replacement_words = rng.sample(range(1000, 10000), min(count, 9000))
+    replacement_ports = rng.sample(range(1024, 65536), min(count, 64512))
+    mappings = []
+    for i, number in enumerate(replacement_words):
+        mappings.append((f"original{chr(97 + i % 26)}{chr(97 + i // 26 % 26)}{chr(97 + i // 676 % 26)}",
+                         f"word_{number}", "word"))
+    for i in range(count):
+        mappings.append((f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+                         f"172.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}", "ip"))
+    for i, number in enumerate(replacement_ports):
+        mappings.append((f":{i + 1}", f":{number}", "port"))
+    return mappings
+
+def write_mappings(mappings, mappings_file):
+    """Writes the mappings in the same CSV layout as save_mappings_to_csv."""
+    with open(mappings_file, "w", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["original", "replacement", "type"])
+        writer.writerows(mappings)
+
+def generate_encrypted_lines(mappings, line_count, seed=0):
+    """Generates deterministic encrypted log lines built from the replacement side of the mappings."""
+    rng = random.Random(seed)
+    words = [replacement for _, replacement, kind in mappings if kind == "word"]
+    ips = [replacement for _, replacement, kind in mappings if kind == "ip"]
+    ports = [replacement for _, replacement, kind in mappings if kind == "port"]
+    for _ in range(line_count):
+        text = " ".join(rng.choice(words) for _ in range(6))
+        yield f"{text} {rng.choice(words)} {rng.choice(ips)}{rng.choice(ports)} {rng.choice(words)}\n"
+
+def run_once(tmp_dir, mappings, mappings_file, line_count, seed):
+    """Decrypts a synthetic log of line_count lines and returns (size in MB, decrypt seconds)."""
+    encrypted_file = os.path.join(tmp_dir, "encrypted.log")
+    decrypted_file = os.path.join(tmp_dir, "decrypted.log")
+
+    with open(encrypted_file, "w") as f:
+        f.writelines(generate_encrypted_lines(mappings, line_count, seed))
+
+    start = time.perf_counter()
+    encrypt_file_content.decrypt_content(encrypted_file, mappings_file, decrypted_file)
+    seconds = time.perf_counter() - start
+
+    return os.path.getsize(encrypted_file) / (1024 * 1024), seconds
+
+
+if __name__ == "__main__":
+    main()
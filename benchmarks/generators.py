@@ -0,0 +1,148 @@
+"""
+Deterministic synthetic data for the benchmarks: log files with a controllable vocabulary size and IP/port
+density, and source trees with a controllable depth, file count and file size. The same arguments and seed
+always produce the same data, so the results of different runs are comparable.
+
+Functions:
+    - make_vocabulary(size, seed): Returns size distinct words.
+    - generate_log_lines(line_count, ...): Yields synthetic log lines.
+    - write_log(path, line_count, ...): Writes a synthetic log file and returns its size.
+    - generate_source_tree(root, file_count, ...): Creates a synthetic source tree and returns its size.
+"""
+
+import os
+import sys
+import random
+import string
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.io_extender import open_buffered_writer
+
+# Lines of code the synthetic source files are made of, {name} is replaced by a vocabulary word
+CODE_LINES = (
+    "def {name}(value, *args):\n",
+    "    return {name}_helper(value) + 1\n",
+    "import {name}\n",
+    "class {name}Handler(Base):\n",
+    "    # TODO: handle {name} errors\n",
+    "    result = [{name} for {name} in items if {name}]\n",
+    "export const {name} = () => null;\n",
+    "\n",
+)
+# Non-ASCII separators and words mixed into the logs with non_ascii_density, as found in real logs
+NON_ASCII_SEPARATORS = ("\u201c", "\u201d", "\u2014", "\u00a0", " \u2192 ")
+NON_ASCII_WORDS = ("caf\u00e9", "na\u00efve", "\u00fcber", "\u0441\u0435\u0440\u0432\u0435\u0440")
+
+
+def make_vocabulary(size, seed=0):
+    """Returns size distinct lowercase words of 3 to 10 letters, in a deterministic order."""
+    rng = random.Random(f"{seed}-vocabulary")
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+def generate_log_lines(line_count, vocabulary_size=1000, ip_density=0.2, port_density=0.5, words_per_line=8,
+                       continuation_density=0.0, non_ascii_density=0.0, seed=0):
+    """
+    Yields line_count synthetic log lines.
+
+    :param line_count: The number of lines.
+    :param vocabulary_size: The number of distinct words the lines are made of.
+    :param ip_density: The probability that a line contains an IP address.
+    :param port_density: The probability that an IP address is followed by a port.
+    :param words_per_line: The number of words of a line.
+    :param continuation_density: The probability that a line is followed by its continuation (the same line
+                                 with " Retrying..." appended), as LineMatcher001 looks for.
+    :param non_ascii_density: The probability that a word is non-ASCII, and that two words are separated by
+                              non-ASCII punctuation (quotes, dash, no-break space, ...) instead of a space.
+    :param seed: The seed of the generator.
+    """
+    rng = random.Random(f"{seed}-log")
+    vocabulary = make_vocabulary(vocabulary_size, seed)
+    produced = 0
+    while produced < line_count:
+        words = [rng.choice(vocabulary) for _ in range(words_per_line)]
+        if rng.random() < ip_density:
+            address = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+            if rng.random() < port_density:
+                address += f":{rng.randint(1, 65535)}"
+            words.insert(rng.randrange(len(words) + 1), address)
+        if non_ascii_density:
+            words = [rng.choice(NON_ASCII_WORDS) if rng.random() < non_ascii_density else word for word in words]
+            line = words[0] + "".join(
+                (rng.choice(NON_ASCII_SEPARATORS) if rng.random() < non_ascii_density else " ") + word
+                for word in words[1:])
+        else:
+            line = " ".join(words)
+        yield line + "\n"
+        produced += 1
+        if produced < line_count and rng.random() < continuation_density:
+            yield line + " Retrying...\n"
+            produced += 1
+
+def write_log(path, line_count, **options):
+    """
+    Writes a synthetic log file, see generate_log_lines for the options.
+
+    :param path: The path of the log file.
+    :param line_count: The number of lines.
+    :return: The size of the file in bytes.
+    """
+    with open_buffered_writer(path) as f:
+        f.writelines(generate_log_lines(line_count, **options))
+    return os.path.getsize(path)
+
+def generate_source_tree(root, file_count, depth=3, fanout=4, file_size=2048, extensions=(".py", ".ts", ".md"),
+                         excluded_file_count=0, seed=0):
+    """
+    Creates a synthetic source tree under root/src: file_count files spread over the directories of a tree
+    depth levels deep with fanout subdirectories per directory. Each file holds about file_size bytes of
+    code-like lines. Another excluded_file_count files go into root/src/node_modules, to measure how cheaply
+    excluded directories are skipped.
+
+    :param root: The directory the tree is created in.
+    :param file_count: The number of files outside of node_modules.
+    :param depth: The number of directory levels below root/src.
+    :param fanout: The number of subdirectories of every directory.
+    :param file_size: The approximate size of every file in bytes.
+    :param extensions: The extensions the files are given, in turn.
+    :param excluded_file_count: The number of files in root/src/node_modules.
+    :param seed: The seed of the generator.
+    :return: The total size in bytes of the files outside of node_modules.
+    """
+    rng = random.Random(f"{seed}-tree")
+    vocabulary = make_vocabulary(200, seed)
+    src = os.path.join(root, "src")
+
+    directories = [src]
+    level = [src]
+    for _ in range(depth):
+        level = [os.path.join(parent, f"pkg{index}") for parent in level for index in range(fanout)]
+        directories.extend(level)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    total_size = 0
+    for index in range(file_count):
+        path = os.path.join(rng.choice(directories), f"module{index}{extensions[index % len(extensions)]}")
+        total_size += write_source_file(path, file_size, vocabulary, rng)
+
+    excluded = os.path.join(src, "node_modules", "vendor")
+    os.makedirs(excluded, exist_ok=True)
+    for index in range(excluded_file_count):
+        write_source_file(os.path.join(excluded, f"bundle{index}.js"), file_size, vocabulary, rng)
+    return total_size
+
+def write_source_file(path, file_size, vocabulary, rng):
+    """Writes about file_size bytes of code-like lines to path and returns the size written."""
+    lines = []
+    size = 0
+    while size < file_size:
+        line = rng.choice(CODE_LINES).format(name=rng.choice(vocabulary))
+        lines.append(line)
+        size += len(line)
+    with open(path, "w") as f:
+        f.writelines(lines)
+    return size
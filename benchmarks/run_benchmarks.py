@@ -0,0 +1,293 @@
+"""
+Benchmark suite for the scripts of this repository, run on deterministic synthetic data (see generators.py)
+across sizes doubling at every step.
+
+Benchmarks:
+    - encrypt: encrypt_file_content.encrypt_content on a synthetic log.
+    - decrypt: encrypt_file_content.decrypt_content on the encryption of a synthetic log.
+    - encrypt_binary, decrypt_binary: The same in binary mode, on the mapped bytes of the files. Before
+      timing, encrypt_binary checks that binary and text mode give the same output on a log with non-ASCII
+      words and punctuation, see check_binary_matches_text.
+    - linematcher: LineMatcher001.match_lines over a log with continuation lines.
+    - linematcher_whole_file: LineMatcher001.match_lines_windowed with no window limit.
+    - walk: extract_files_to_text.list_files_with_extensions over a synthetic source tree.
+    - export: extract_files_to_text.export_project of the same tree.
+
+Every case runs in its own process, so caches and memory of one case do not leak into the next. The best
+time of --repeat runs is kept, then one more run measures the peak of Python allocations with tracemalloc.
+Results are printed and, with --output, written to JSON together with the run parameters. --compare prints
+the change of every time against a previous JSON result.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --steps 4 --output results.json
+    python benchmarks/run_benchmarks.py --only encrypt decrypt --compare results.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import LineMatcher001
+import encrypt_file_content
+import extract_files_to_text
+from common.io_extender import iter_file_lines, iter_non_empty_lines
+from generators import generate_source_tree, write_log
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Extensions of the synthetic source files, all exported
+TREE_EXTENSIONS = [".py", ".ts", ".md"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scripts on synthetic data of growing size.")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Benchmarks to run (default: all).")
+    parser.add_argument("--steps", type=int, default=3, help="Number of sizes, doubling at every step.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per case, the best is kept.")
+    parser.add_argument("--base-lines", type=int, default=20000, help="Number of log lines of the smallest case.")
+    parser.add_argument("--vocabulary", type=int, default=2000, help="Number of distinct words of the logs.")
+    parser.add_argument("--ip-density", type=float, default=0.3, help="Probability that a log line has an IP.")
+    parser.add_argument("--port-density", type=float, default=0.5, help="Probability that an IP has a port.")
+    parser.add_argument("--base-files", type=int, default=500, help="Number of source files of the smallest tree.")
+    parser.add_argument("--depth", type=int, default=3, help="Directory depth of the source trees.")
+    parser.add_argument("--file-size", type=int, default=4096, help="Approximate size of every source file in bytes.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the data generators and of the encryption.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare the times with those of a previous JSON result.")
+    args = parser.parse_args()
+
+    if args.steps < 1 or args.repeat < 1:
+        parser.error("--steps and --repeat must be at least 1")
+
+    previous = load_results(args.compare) if args.compare else {}
+    results = []
+    print(f"{'benchmark':<24} {'size':>8} {'MB':>8} {'seconds':>9} {'MB/s':>8} {'items/s':>10} {'peak KB':>9} {'change':>8}")
+    for name in args.only or list(BENCHMARKS):
+        for step in range(args.steps):
+            result = run_case_in_process(name, step, vars(args))
+            results.append(result)
+            print(format_result(result, previous.get((result["benchmark"], result["size"]))))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": run_metadata(args), "results": results}, f, indent=2)
+        print(f"Results written to: {args.output}")
+
+def run_case_in_process(name, step, options):
+    """Runs one benchmark case in a fresh process and returns its result."""
+    with multiprocessing.get_context().Pool(1) as pool:
+        return pool.apply(run_case, (name, step, options))
+
+def run_case(name, step, options):
+    """
+    Sets up one benchmark case in a temporary directory, then times it and measures its memory.
+
+    :param name: The name of the benchmark, a key of BENCHMARKS.
+    :param step: The size step, the size is the base size times 2 ** step.
+    :param options: The command line options as a dict.
+    :return: The result as a dict.
+    """
+    setup, unit = BENCHMARKS[name]
+    with tempfile.TemporaryDirectory() as work_dir:
+        size, run, data_bytes = setup(work_dir, step, options)
+
+        # the scripts report progress on stdout, which is not part of what is measured here
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            seconds = None
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                items = run()
+                elapsed = time.perf_counter() - start
+                seconds = elapsed if seconds is None else min(seconds, elapsed)
+                output.seek(0)
+                output.truncate()
+
+            tracemalloc.start()
+            run()
+            peak_traced = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return {
+        "benchmark": name,
+        "size": size,
+        "unit": unit,
+        "bytes": data_bytes,
+        "items": items,
+        "seconds": seconds,
+        "mb_per_s": data_bytes / (1024 * 1024) / seconds if seconds else None,
+        "items_per_s": items / seconds if seconds else None,
+        "peak_traced_kb": peak_traced // 1024,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+    }
+
+def setup_log(work_dir, step, options, continuation_density=0.0):
+    """Writes the synthetic log of a size step and returns (line count, log path, size in bytes)."""
+    line_count = options["base_lines"] * 2 ** step
+    log_path = os.path.join(work_dir, "input.log")
+    data_bytes = write_log(log_path, line_count, vocabulary_size=options["vocabulary"],
+                           ip_density=options["ip_density"], port_density=options["port_density"],
+                           continuation_density=continuation_density, seed=options["seed"])
+    return line_count, log_path, data_bytes
+
+def setup_encrypt(work_dir, step, options, binary=False):
+    """Times the encryption of a synthetic log, with a fresh seeded Anonymizer every run."""
+    line_count, log_path, data_bytes = setup_log(work_dir, step, options)
+
+    def run():
+        anonymizer = encrypt_file_content.Anonymizer(seed=options["seed"])
+        encrypt_file_content.encrypt_content(log_path, os.path.join(work_dir, "encrypted.log"),
+                                             os.path.join(work_dir, "mappings.csv"), anonymizer, binary=binary)
+        return line_count
+    return line_count, run, data_bytes
+
+def setup_encrypt_binary(work_dir, step, options):
+    """Times the encryption of a synthetic log in binary mode."""
+    check_binary_matches_text(work_dir, options)
+    return setup_encrypt(work_dir, step, options, binary=True)
+
+def check_binary_matches_text(work_dir, options, line_count=2000):
+    """
+    Encrypts a log with non-ASCII words and punctuation in text and in binary mode, then decrypts it again,
+    and raises a RuntimeError unless both modes give the same outputs and mappings.
+    """
+    log_path = os.path.join(work_dir, "non_ascii.log")
+    write_log(log_path, line_count, vocabulary_size=options["vocabulary"], ip_density=options["ip_density"],
+              port_density=options["port_density"], non_ascii_density=0.2, seed=options["seed"])
+    outputs = []
+    for binary in (False, True):
+        suffix = "binary" if binary else "text"
+        encrypted_path = os.path.join(work_dir, f"non_ascii_{suffix}.log")
+        mappings_path = os.path.join(work_dir, f"non_ascii_{suffix}.csv")
+        decrypted_path = os.path.join(work_dir, f"non_ascii_{suffix}_decrypted.log")
+        encrypt_file_content.encrypt_content(log_path, encrypted_path, mappings_path,
+                                             encrypt_file_content.Anonymizer(seed=options["seed"]), binary=binary)
+        encrypt_file_content.decrypt_content(encrypted_path, mappings_path, decrypted_path, binary=binary)
+        output = []
+        for path in (encrypted_path, mappings_path, decrypted_path):
+            with open(path, "rb") as f:
+                output.append(f.read())
+        outputs.append(output)
+    if outputs[0] != outputs[1]:
+        raise RuntimeError("Binary mode differs from text mode on a log with non-ASCII words and punctuation.")
+
+def setup_decrypt(work_dir, step, options, binary=False):
+    """Times the decryption of the encryption of a synthetic log."""
+    line_count, log_path, _ = setup_log(work_dir, step, options)
+    encrypted_path = os.path.join(work_dir, "encrypted.log")
+    mappings_path = os.path.join(work_dir, "mappings.csv")
+    encrypt_file_content.encrypt_content(log_path, encrypted_path, mappings_path,
+                                         encrypt_file_content.Anonymizer(seed=options["seed"]))
+
+    def run():
+        encrypt_file_content.decrypt_content(encrypted_path, mappings_path, os.path.join(work_dir, "decrypted.log"),
+                                             binary=binary)
+        return line_count
+    return line_count, run, os.path.getsize(encrypted_path)
+
+def setup_decrypt_binary(work_dir, step, options):
+    """Times the decryption of the encryption of a synthetic log in binary mode."""
+    return setup_decrypt(work_dir, step, options, binary=True)
+
+def setup_linematcher(work_dir, step, options, window=False):
+    """Times LineMatcher001 over a synthetic log where a fifth of the lines are followed by a continuation."""
+    line_count, log_path, data_bytes = setup_log(work_dir, step, options, continuation_density=0.2)
+
+    def run():
+        lines = iter_non_empty_lines(iter_file_lines(log_path))
+        results = LineMatcher001.match_lines_windowed(lines) if window else LineMatcher001.match_lines(lines)
+        for _ in results:
+            pass
+        return line_count
+    return line_count, run, data_bytes
+
+def setup_linematcher_whole_file(work_dir, step, options):
+    """Times LineMatcher001 in whole-file mode."""
+    return setup_linematcher(work_dir, step, options, window=True)
+
+def setup_tree(work_dir, step, options):
+    """Generates the synthetic source tree of a size step and returns (file count, project config, size)."""
+    file_count = options["base_files"] * 2 ** step
+    data_bytes = generate_source_tree(work_dir, file_count, depth=options["depth"], file_size=options["file_size"],
+                                      extensions=TREE_EXTENSIONS, excluded_file_count=file_count // 4,
+                                      seed=options["seed"])
+    output_dir = os.path.join(work_dir, "output")
+    os.makedirs(output_dir)
+    cfg = {"fetch_path": os.path.join(work_dir, "src"), "root_dir_name": "src", "exclude_dirs_list": ["node_modules"],
+           "exclude_files_list": [], "include_files_extensions": TREE_EXTENSIONS, "output_file_name": "bench",
+           "output_file_path": output_dir, "version": "v1", "respect_gitignore": False, "skip_binary_files": False,
+           "max_file_size": None, "shard_max_bytes": None, "shard_max_lines": None, "shard_max_tokens": None}
+    return file_count, cfg, data_bytes
+
+def setup_walk(work_dir, step, options):
+    """Times the listing of the files of a synthetic source tree."""
+    file_count, cfg, data_bytes = setup_tree(work_dir, step, options)
+
+    def run():
+        return len(extract_files_to_text.list_files_with_extensions(
+            cfg["fetch_path"], cfg["exclude_dirs_list"], cfg["exclude_files_list"], cfg["include_files_extensions"]))
+    return file_count, run, data_bytes
+
+def setup_export(work_dir, step, options):
+    """Times the export of a synthetic source tree into a fresh output every run."""
+    file_count, cfg, data_bytes = setup_tree(work_dir, step, options)
+
+    def run():
+        # the default export appends, start every run from an empty output
+        for name in os.listdir(cfg["output_file_path"]):
+            os.remove(os.path.join(cfg["output_file_path"], name))
+        extract_files_to_text.export_project(cfg)
+        return file_count
+    return file_count, run, data_bytes
+
+# Benchmark name -> (setup function, unit of the size)
+BENCHMARKS = {
+    "encrypt": (setup_encrypt, "lines"),
+    "decrypt": (setup_decrypt, "lines"),
+    "encrypt_binary": (setup_encrypt_binary, "lines"),
+    "decrypt_binary": (setup_decrypt_binary, "lines"),
+    "linematcher": (setup_linematcher, "lines"),
+    "linematcher_whole_file": (setup_linematcher_whole_file, "lines"),
+    "walk": (setup_walk, "files"),
+    "export": (setup_export, "files"),
+}
+
+def run_metadata(args):
+    """Returns the parameters of the run, stored with the results so that runs can be compared."""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+    }
+
+def load_results(path):
+    """Loads a JSON result file as a dict of (benchmark, size) -> seconds."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {(result["benchmark"], result["size"]): result["seconds"] for result in data["results"]}
+
+def format_result(result, previous_seconds=None):
+    """Formats one result as a table row, with the change of time against a previous result if any."""
+    change = f"{(result['seconds'] / previous_seconds - 1) * 100:+.0f}%" if previous_seconds else ""
+    return (f"{result['benchmark']:<24} {result['size']:>8} {result['bytes'] / (1024 * 1024):>8.2f} "
+            f"{result['seconds']:>9.3f} {result['mb_per_s']:>8.2f} {result['items_per_s']:>10.0f} "
+            f"{result['peak_traced_kb']:>9} {change:>8}")
+
+
+if __name__ == "__main__":
+    main()
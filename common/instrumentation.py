@@ -0,0 +1,352 @@
+#!/usr/bin/python3
+"""
+Instrumentation shared by the scripts of this repository: per-stage timers and counters (walk, read,
+transform, write, ...) with their throughput, the per-file progress output with a quiet mode that replaces
+it by a single rate-limited progress line, and optional profiling of a whole run with cProfile or tracemalloc.
+
+Classes:
+    - RunStats(quiet, unit, progress_interval, stream): Stage timers and counters, and progress output.
+    - ThreadProfiles(enabled): Profiles the functions run in other threads, for profiled to merge them.
+
+Functions:
+    - profiled(mode, output_path): Context manager profiling its body with cProfile or tracemalloc.
+    - add_instrumentation_arguments(parser, quiet): Adds --stats, --profile, --profile-output and --quiet.
+"""
+import io
+import sys
+import time
+import pstats
+import threading
+import cProfile
+import tracemalloc
+import contextlib
+
+# Minimum number of seconds between two updates of the progress line in quiet mode
+PROGRESS_INTERVAL = 0.5
+# Width the progress line is padded to, so that a shorter line fully covers the previous one
+PROGRESS_WIDTH = 79
+# Profiling modes of --profile, and the file they write to unless --profile-output is given
+PROFILE_OUTPUTS = {"cprofile": "profile.pstats", "tracemalloc": "profile_tracemalloc.txt"}
+# Number of functions or allocation sites shown in profiling reports
+PROFILE_TOP = 25
+
+
+class RunStats:
+    """
+    Times and counts the stages of a run. Time spent in a stage nested in another one (e.g. the walk feeding
+    the reads of an export) is only counted for the inner stage, so the stage times add up to the time the
+    run spent in them. Only the calling thread is timed: work done by background threads shows up as the
+    time spent waiting for it.
+
+    Per-file messages go through progress(): they are printed as before, or in quiet mode replaced by one
+    progress line on stderr, rewritten at most every progress_interval seconds.
+
+    Untimed, stages and timed_iter cost next to nothing, so functions can always be given a RunStats: the
+    scripts only time their stages with --stats or --quiet.
+    """
+
+    def __init__(self, quiet=False, timed=True, unit="files", progress_interval=PROGRESS_INTERVAL, stream=None,
+                 label=None):
+        """
+        :param quiet: Replace the per-file messages with a rate-limited progress line.
+        :param timed: Time and count the stages. Without, only progress() counts.
+        :param unit: What the progress counts, as shown in the progress line and the report.
+        :param progress_interval: Minimum number of seconds between two updates of the progress line.
+        :param stream: Where the progress line is written. Defaults to stderr.
+        :param label: Optional name prefixed to the messages and the progress line, e.g. the project of a run
+                      exporting several projects at once.
+        """
+        self.quiet = quiet
+        self.prefix = f"[{label}] " if label else ""
+        self.timed = timed
+        self.unit = unit
+        self.progress_interval = progress_interval
+        self.stream = stream if stream is not None else sys.stderr
+        # stage name -> [seconds, items, bytes], in order of first use
+        self.stages = {}
+        self.processed = 0
+        self.start_time = time.perf_counter()
+        self._last_progress = None
+        # time spent in nested stages, for every stage being timed
+        self._child_seconds = []
+
+    def stage(self, name, items=0, nbytes=0):
+        """
+        Return a context manager timing its body as a stage.
+
+        :param name: The name of the stage.
+        :param items: Number of items the body processes.
+        :param nbytes: Number of bytes the body processes.
+        """
+        if not self.timed:
+            return UNTIMED_STAGE
+        return StageTimer(self, name, items, nbytes)
+
+    def timed_iter(self, name, iterable, count_bytes=None):
+        """
+        Wrap an iterable so that the time spent producing each item is added to a stage, with one item
+        counted per item produced.
+
+        :param name: The name of the stage.
+        :param iterable: The iterable, typically a lazy generator such as a directory walk.
+        :param count_bytes: Optional function returning the number of bytes of an item.
+        :return: An iterator over the items of iterable, iterable itself if untimed.
+        """
+        if not self.timed:
+            return iterable
+        return self._timed_iter(name, iterable, count_bytes)
+
+    def _timed_iter(self, name, iterable, count_bytes):
+        """Generator behind timed_iter."""
+        iterator = iter(iterable)
+        while True:
+            self._child_seconds.append(0.0)
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._end_timing(name, start, 0, 0)
+                return
+            except BaseException:
+                self._end_timing(name, start, 0, 0)
+                raise
+            self._end_timing(name, start, 1, count_bytes(item) if count_bytes else 0)
+            yield item
+
+    def add(self, name, seconds=0.0, items=0, nbytes=0):
+        """
+        Add time and counts to a stage.
+
+        :param name: The name of the stage.
+        :param seconds: Time spent in the stage.
+        :param items: Number of items processed.
+        :param nbytes: Number of bytes processed.
+        """
+        if not self.timed:
+            return
+        totals = self.stages.setdefault(name, [0.0, 0, 0])
+        totals[0] += seconds
+        totals[1] += items
+        totals[2] += nbytes
+
+    def progress(self, message=None):
+        """
+        Count one processed item and report it: print message, or in quiet mode update the progress line if
+        it was last written more than progress_interval seconds ago.
+
+        :param message: The per-item message, e.g. "Processing: <path>". None only counts the item.
+        """
+        self.processed += 1
+        if not self.quiet:
+            if message is not None:
+                # one write per message, so that the messages of runs in several threads do not interleave
+                sys.stdout.write(f"{self.prefix}{message}\n")
+            return
+        now = time.perf_counter()
+        if self._last_progress is None or now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.stream.write(f"\r{self.progress_line():<{PROGRESS_WIDTH}}")
+            self.stream.flush()
+
+    def log(self, message):
+        """
+        Print a message that is shown in quiet mode too, such as where the output was written. An open
+        progress line is ended first.
+
+        :param message: The message.
+        """
+        self.finish()
+        sys.stdout.write(f"{self.prefix}{message}\n")
+
+    def progress_line(self):
+        """Return the progress so far: items processed, bytes written if there is a write stage, and their rates."""
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        line = f"{self.prefix}{self.processed} {self.unit}, {self.processed / elapsed:.0f} {self.unit}/s"
+        if "write" in self.stages:
+            megabytes = self.stages["write"][2] / (1024 * 1024)
+            line += f", {megabytes:.1f} MB written, {megabytes / elapsed:.1f} MB/s"
+        return f"{line}, {elapsed:.1f}s"
+
+    def finish(self):
+        """End the progress line, if one was written, so that what follows starts on a new line."""
+        if self._last_progress is not None:
+            self.stream.write(f"\r{self.progress_line():<{PROGRESS_WIDTH}}\n")
+            self.stream.flush()
+            self._last_progress = None
+
+    def report(self):
+        """
+        Return the report of the run: time, items, megabytes and their rates for every stage, then the totals.
+
+        :return: The report as a multi-line string.
+        """
+        lines = [f"{'stage':<12} {'seconds':>9} {'items':>9} {'MB':>9} {'items/s':>10} {'MB/s':>9}"]
+        for name, (seconds, items, nbytes) in self.stages.items():
+            megabytes = nbytes / (1024 * 1024)
+            items_rate = f"{items / seconds:.0f}" if seconds and items else "-"
+            bytes_rate = f"{megabytes / seconds:.2f}" if seconds and nbytes else "-"
+            lines.append(f"{name:<12} {seconds:>9.3f} {items:>9} {megabytes:>9.2f} {items_rate:>10} {bytes_rate:>9}")
+        lines.append(f"Total: {self.progress_line()}")
+        return "\n".join(lines)
+
+    def _end_timing(self, name, start, items, nbytes):
+        """Add the time since start, minus the time of nested stages, to a stage and to its parent's children."""
+        elapsed = time.perf_counter() - start
+        child_seconds = self._child_seconds.pop()
+        totals = self.stages.get(name)
+        if totals is None:
+            totals = self.stages[name] = [0.0, 0, 0]
+        totals[0] += elapsed - child_seconds
+        totals[1] += items
+        totals[2] += nbytes
+        if self._child_seconds:
+            self._child_seconds[-1] += elapsed
+
+
+class StageTimer:
+    """
+    Context manager returned by RunStats.stage. A plain class rather than a contextlib generator, as stages
+    are entered for every file or chunk and the timing must stay cheap next to the work it measures.
+    """
+    __slots__ = ("stats", "name", "items", "nbytes", "start")
+
+    def __init__(self, stats, name, items, nbytes):
+        self.stats = stats
+        self.name = name
+        self.items = items
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.stats._child_seconds.append(0.0)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats._end_timing(self.name, self.start, self.items, self.nbytes)
+        return False
+
+
+class UntimedStage:
+    """Context manager returned by RunStats.stage when untimed, doing nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+UNTIMED_STAGE = UntimedStage()
+
+
+class ThreadProfiles:
+    """
+    Yielded by profiled. Before Python 3.12, cProfile only profiles the thread that enables it, so a body
+    handing its work to a thread pool runs that work through run(): with "cprofile", every call gets its own
+    profiler, merged by profiled into the profile of the body. Since 3.12 cProfile is built on sys.monitoring,
+    which sees every thread but allows a single active profiler, so the profile of the body already covers
+    the threads (calls interleaved from several threads only skew its primitive call counts) and run() simply
+    calls the function, as it does without "cprofile".
+    """
+
+    def __init__(self, enabled=False):
+        """
+        :param enabled: Whether run() profiles the functions it calls.
+        """
+        self.enabled = enabled
+        self.profilers = []
+        self._lock = threading.Lock()
+
+    def run(self, function, *args, **kwargs):
+        """
+        Call function(*args, **kwargs), profiled if enabled.
+
+        :return: What the function returns.
+        """
+        if not self.enabled:
+            return function(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is already active: profiling must never make the function fail
+            return function(*args, **kwargs)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with self._lock:
+                self.profilers.append(profiler)
+
+
+@contextlib.contextmanager
+def profiled(mode=None, output_path=None):
+    """
+    Context manager profiling its body.
+
+    With "cprofile", the pstats data is written to output_path, to be explored with `python -m pstats`, and
+    the functions with the highest cumulative time are printed. Only the calling thread is profiled, plus the
+    functions the body runs through the ThreadProfiles it is given (as yielded by the with statement). With
+    "tracemalloc", the allocation sites holding the most memory at the end of the body, in any thread, and the
+    peak of traced memory are written to output_path. With None, the body runs unprofiled.
+
+    :param mode: None, "cprofile" or "tracemalloc".
+    :param output_path: The file the profile is written to. Defaults to PROFILE_OUTPUTS[mode].
+    """
+    if mode is None:
+        yield ThreadProfiles()
+        return
+    if mode not in PROFILE_OUTPUTS:
+        raise ValueError(f"Unknown profiling mode '{mode}'. Available: {', '.join(PROFILE_OUTPUTS)}")
+    output_path = output_path or PROFILE_OUTPUTS[mode]
+
+    if mode == "cprofile":
+        thread_profiles = ThreadProfiles(enabled=sys.version_info < (3, 12))
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield thread_profiles
+        finally:
+            profiler.disable()
+            summary = io.StringIO()
+            stats = pstats.Stats(profiler, stream=summary)
+            for thread_profiler in thread_profiles.profilers:
+                # a profiler that recorded no call cannot be loaded by pstats
+                if thread_profiler.getstats():
+                    stats.add(thread_profiler)
+            stats.dump_stats(output_path)
+            stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+            print(summary.getvalue())
+            print(f"Profile written to: {output_path}")
+        return
+
+    tracemalloc.start()
+    try:
+        yield ThreadProfiles()
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(f"Peak traced memory: {peak / 1024:.0f} KB\n")
+            f.write(f"Top {PROFILE_TOP} allocation sites still holding memory:\n")
+            for statistic in snapshot.statistics("lineno")[:PROFILE_TOP]:
+                f.write(f"{statistic}\n")
+        print(f"Peak traced memory: {peak / 1024:.0f} KB, profile written to: {output_path}")
+
+def add_instrumentation_arguments(parser, quiet=True):
+    """
+    Add the instrumentation options to a command line parser: --stats, --profile, --profile-output and,
+    for scripts printing a message per file, --quiet.
+
+    :param parser: The argparse parser.
+    :param quiet: Whether to add --quiet.
+    """
+    parser.add_argument("--stats", action="store_true",
+                        help="Print the time, items and MB/s of every stage at the end of the run.")
+    parser.add_argument("--profile", choices=sorted(PROFILE_OUTPUTS),
+                        help="Profile the run with cProfile or tracemalloc.")
+    parser.add_argument("--profile-output",
+                        help="File the profile is written to (default: profile.pstats or profile_tracemalloc.txt).")
+    if quiet:
+        parser.add_argument("-q", "--quiet", action="store_true",
+                            help="Replace the per-file messages with a progress line on stderr.")
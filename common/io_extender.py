@@ -1,15 +1,222 @@
 #!/usr/bin/python3
 """
+Shared file I/O helpers for the scripts of this repository, so that every script reads and writes files the
+same streaming way: lazy line iterators, chunked byte readers, mmap-backed reading of large files, encoding
+detection with a fast path for UTF-8, and buffered writers.
+
+Functions:
+    - read_file_to_lines(file_name, folder_path, encoding, errors): Reads a file and returns it as a list of lines.
+    - remove_empty_lines(lines): Removes empty lines from a list of lines.
+    - iter_file_lines(file_name, folder_path, encoding, errors): Lazily yields the lines of a file, or of stdin for "-".
+    - iter_non_empty_lines(lines): Lazily drops empty lines.
+    - read_text(file_path, encoding, errors): Reads the whole content of a text file.
+    - list_input_files(input_path): Lists the files of a directory (recursively), a glob pattern or a single file.
+    - split_file_ranges(file_path, shard_size): Splits a file into byte ranges of whole lines.
+    - iter_file_range_lines(file_path, start, end, encoding, errors): Lazily yields the lines of a byte range.
+    - iter_chunks(file_path, chunk_size): Lazily yields the content of a file as chunks of bytes.
+    - map_file(file_path): Maps a whole file read-only in memory.
+    - open_mmap(file_path): Context manager around map_file.
+    - detect_encoding(file_path, sample_size, fallback): Guesses the encoding of a file from its first bytes.
+    - open_buffered_writer(file_path, mode, encoding, errors, buffer_size): Opens a file for writing with a large buffer.
+
+Encodings: None means the locale encoding, as for open(), and "auto" means detect_encoding.
 """
+import io
 import os
+import sys
+import glob
+import mmap
+import codecs
+import contextlib
 
-def read_file_to_lines(file_name, folder_path = ''):
+# Size of the chunks read by iter_chunks
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# Size of the buffer of open_buffered_writer, so that many small writes reach the disk in large ones
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# Size of the byte ranges split_file_ranges cuts large files into
+DEFAULT_SHARD_SIZE = 64 * 1024 * 1024
+# Number of leading bytes detect_encoding looks at
+ENCODING_SNIFF_SIZE = 64 * 1024
+# Byte order marks recognized by detect_encoding, UTF-32 first as its little endian BOM starts like UTF-16's
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+def read_file_to_lines(file_name, folder_path = '', encoding=None, errors=None):
     """ Read file and return it in list of lines """
     file_path = os.path.join(folder_path, file_name) if folder_path else file_name
-    file_obj = open(file_path, "r")
-    lines = file_obj.readlines()
-    file_obj.close()
-    return lines
+    with open(file_path, "r", encoding=resolve_encoding(file_path, encoding), errors=errors) as file_obj:
+        return file_obj.readlines()
 
 def remove_empty_lines(lines):
-    return [line for line in lines if line.strip() ]
\ No newline at end of file
+    """Remove empty lines from a list of lines."""
+    return [line for line in lines if line.strip() ]
+
+def iter_file_lines(file_name, folder_path = '', encoding=None, errors=None):
+    """ Lazily yield the lines of a file, or of stdin if file_name is "-" """
+    if file_name == "-":
+        yield from sys.stdin
+        return
+    file_path = os.path.join(folder_path, file_name) if folder_path else file_name
+    with open(file_path, "r", encoding=resolve_encoding(file_path, encoding), errors=errors) as file_obj:
+        yield from file_obj
+
+def iter_non_empty_lines(lines):
+    """Lazily drop empty lines from an iterable of lines."""
+    return (line for line in lines if line.strip())
+
+def read_text(file_path, encoding=None, errors=None):
+    """
+    Read the whole content of a text file.
+
+    :param file_path: The path of the file.
+    :param encoding: The encoding of the file, None for the locale encoding or "auto" to detect it.
+    :param errors: How decoding errors are handled, as for open().
+    :return: The content of the file.
+    """
+    with open(file_path, "r", encoding=resolve_encoding(file_path, encoding), errors=errors) as file_obj:
+        return file_obj.read()
+
+def list_input_files(input_path):
+    """
+    List the files of an input given on the command line: every file below a directory, the files matching
+    a glob pattern ("**" matches any number of directories), or the file itself.
+
+    :param input_path: A directory, a glob pattern or a file path.
+    :return: The sorted list of file paths, empty if nothing matches.
+    """
+    if os.path.isdir(input_path):
+        files = [os.path.join(path, name) for path, _, names in os.walk(input_path) for name in names]
+    elif os.path.isfile(input_path):
+        # checked before glob, so that file names containing [ or ? are not taken as patterns
+        files = [input_path]
+    else:
+        files = [file for file in glob.glob(input_path, recursive=True) if os.path.isfile(file)]
+    return sorted(files)
+
+def split_file_ranges(file_path, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Split a file into consecutive byte ranges of about shard_size bytes, each ending just after a newline, so
+    that every range holds whole lines and the ranges can be read independently, e.g. by several processes.
+    Only valid for encodings where a newline is the single byte \n (UTF-8, latin-1, ... but not UTF-16).
+
+    :param file_path: The path of the file.
+    :param shard_size: The approximate size of the ranges in bytes.
+    :return: The list of (start, end) offsets, a single range for a file of at most shard_size bytes.
+    """
+    size = os.path.getsize(file_path)
+    if size <= shard_size:
+        return [(0, size)]
+    starts = [0]
+    with open_mmap(file_path) as data:
+        while starts[-1] + shard_size < size:
+            newline = data.find(b"\n", starts[-1] + shard_size)
+            if newline < 0 or newline + 1 >= size:
+                break
+            starts.append(newline + 1)
+    return list(zip(starts, starts[1:] + [size]))
+
+def iter_file_range_lines(file_path, start, end, encoding=None, errors=None):
+    """
+    Lazily yield the lines of the byte range [start, end) of a file, decoded and split exactly as reading
+    the whole file in text mode would, as long as start is the beginning of a line (see split_file_ranges).
+
+    :param file_path: The path of the file.
+    :param start: The offset of the first byte of the range.
+    :param end: The offset just past the last byte of the range.
+    :param encoding: The encoding of the file, None for the locale encoding or "auto" to detect it.
+    :param errors: How decoding errors are handled, as for open().
+    """
+    encoding = resolve_encoding(file_path, encoding)
+    with open(file_path, "rb") as file_obj:
+        file_obj.seek(start)
+        data = file_obj.read(end - start)
+    yield from io.TextIOWrapper(io.BytesIO(data), encoding=encoding, errors=errors)
+
+def iter_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Lazily yield the content of a file as chunks of bytes, e.g. to hash or copy it without holding it in memory.
+
+    :param file_path: The path of the file.
+    :param chunk_size: The size of the chunks in bytes. The last chunk may be shorter.
+    """
+    with open(file_path, "rb") as file_obj:
+        for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+            yield chunk
+
+def map_file(file_path):
+    """
+    Map a whole file read-only in memory. The mapping supports slicing, find and regex searches without
+    reading the file, and only the pages actually touched are loaded. The caller closes it.
+
+    :param file_path: The path of the file.
+    :return: An mmap, or b"" for an empty file, which cannot be mapped.
+    """
+    with open(file_path, "rb") as file_obj:
+        if os.fstat(file_obj.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+
+@contextlib.contextmanager
+def open_mmap(file_path):
+    """
+    Context manager mapping a whole file read-only in memory, see map_file.
+
+    :param file_path: The path of the file.
+    """
+    data = map_file(file_path)
+    try:
+        yield data
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+def detect_encoding(file_path, sample_size=ENCODING_SNIFF_SIZE, fallback="latin-1"):
+    """
+    Guess the encoding of a file from its first bytes: a byte order mark if there is one, then UTF-8 if the
+    sample is ASCII (checked in C, the fast path for most source files and logs) or decodes as UTF-8,
+    otherwise the fallback encoding.
+
+    :param file_path: The path of the file.
+    :param sample_size: The number of leading bytes to look at.
+    :param fallback: The encoding returned when the sample is not UTF-8. latin-1 decodes any byte.
+    :return: The name of the encoding.
+    """
+    with open(file_path, "rb") as file_obj:
+        sample = file_obj.read(sample_size)
+
+    for bom, encoding in BYTE_ORDER_MARKS:
+        if sample.startswith(bom):
+            return encoding
+    if sample.isascii():
+        return "utf-8"
+    try:
+        # a multi-byte character may be cut at the end of the sample, only a full file must end cleanly
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(sample) < sample_size)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return fallback
+
+def resolve_encoding(file_path, encoding):
+    """Return the encoding to open file_path with: detected if encoding is "auto", else encoding itself."""
+    return detect_encoding(file_path) if encoding == "auto" else encoding
+
+def open_buffered_writer(file_path, mode="w", encoding=None, errors=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    Open a file for writing (or appending) with a large buffer, so that many small writes are sent to the
+    disk in a few large ones. Use it in a with statement, or close it to flush the buffer.
+
+    :param file_path: The path of the file.
+    :param mode: "w", "a", "wb" or "ab".
+    :param encoding: The encoding of text modes, None for the locale encoding.
+    :param errors: How encoding errors are handled in text modes, as for open().
+    :param buffer_size: The size of the buffer in bytes.
+    :return: The file object.
+    """
+    if "b" in mode:
+        return open(file_path, mode, buffering=buffer_size)
+    return open(file_path, mode, buffering=buffer_size, encoding=encoding, errors=errors)
@@ -25,13 +25,45 @@ Encrypting a file:
 Decrypting a file:
     python script.py -d encrypted_output.txt decrypted_output.txt
     python script.py --decrypt encrypted_output.txt decrypted_output.txt
+
+Encrypting every file of a directory (or glob) into an output directory across a process pool:
+    python script.py -e --batch logs/ encrypted_logs/ --workers 8
+    python script.py -e --batch "logs/**/*.log" encrypted_logs/
+
+Processing a file too large to fit in memory, line by line:
+    python script.py -e --stream input.txt encrypted_output.txt
+    python script.py -d --stream encrypted_output.txt decrypted_output.txt
+
+Anonymizing extra token types (emails, UUIDs, ...) defined in a rules file, see load_rules:
+    python script.py -e --rules anonymization_rules.json input.txt encrypted_output.txt
+
+Processing a file as bytes through mmap, where non-UTF-8 bytes pass through unchanged, e.g. a large log in a
+mixed or unknown encoding:
+    python script.py -e --binary input.txt encrypted_output.txt
+    python script.py -d --binary encrypted_output.txt decrypted_output.txt
+
+Timing the read, transform and write stages, or profiling a run:
+    python script.py -e input.txt encrypted_output.txt --stats
+    python script.py -e input.txt encrypted_output.txt --profile cprofile --profile-output encrypt.pstats
 """
 
 import re
 import csv
+import json
+import math
+import mmap
 import random
+import string
+import sqlite3
 import argparse
+import itertools
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from common.instrumentation import RunStats, add_instrumentation_arguments, profiled
+from common.io_extender import (iter_file_lines, list_input_files, open_buffered_writer, open_mmap, read_text,
+                                split_file_ranges)
 
 
 # Define regex patterns for words, IP addresses, and ports
@@ -39,17 +71,532 @@ WORD_PATTERN = r'\b[A-Za-z]+\b'
 IP_PATTERN = r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b'
 PORT_PATTERN = r':\b\d{1,5}\b'  # Ports range between 1 and 65535, prefixed with a colon
 
-# Sets to keep track of used and existing ports and IPs and used words
-used_words = set()
-used_ips = set()
-existing_ips = set()
-used_ports = set()
-existing_ports = set()
+# Content the Anonymizer decodes with surrogateescape, so that any byte round-trips, and matches with the
+# str patterns: a bytes regex would only know ASCII word characters, and lose the word boundaries that
+# non-ASCII punctuation (“ ”, —, NBSP, ...) gives in text mode
+BYTES_LIKE = (bytes, bytearray, memoryview, mmap.mmap)
+# Size of the chunks of the binary mode. A regex substitution allocates many times the size of its input
+# while it builds the result, so small chunks keep the peak memory low at no cost in speed
+BINARY_CHUNK_SIZE = 64 * 1024
+
+# Number of distinct IPs with every octet in 1..255, and the range of non-privileged ports
+IP_SPACE_SIZE = 255 ** 4
+PORT_RANGE_START = 1024
+PORT_RANGE_SIZE = 65536 - PORT_RANGE_START
+
+class TokenAllocator:
+    """
+    Hands out unique integers in O(1) without retries by walking seeded permutations of consecutive ranges.
+    Each range is visited in the order start + (offset + step * i) % size, where step is coprime with size,
+    so every value of the range is produced exactly once. When a range is exhausted the allocator moves on
+    to the next one; a ValueError is raised once all ranges are used up.
+    The permutation only scrambles the order of replacements, it is not meant to be cryptographic.
+    """
+
+    def __init__(self, ranges, seed=None):
+        """
+        :param ranges: An iterable (possibly infinite) of (start, size) tuples to allocate from, in order.
+        :param seed: Optional seed making the sequence of allocated values reproducible.
+        """
+        self.ranges = iter(ranges)
+        self.rng = random.Random(seed)
+        self.start = self.size = self.step = self.offset = self.index = 0
+        self.allocated = 0
+
+    def allocate(self):
+        """Returns the next unused integer."""
+        if self.index >= self.size:
+            self._next_range()
+        value = self.start + (self.offset + self.step * self.index) % self.size
+        self.index += 1
+        self.allocated += 1
+        return value
+
+    def advance(self, count):
+        """Skips count values as if allocate() had been called count times, without generating them."""
+        while count > 0:
+            if self.index >= self.size:
+                self._next_range()
+            taken = min(count, self.size - self.index)
+            self.index += taken
+            self.allocated += taken
+            count -= taken
+
+    def _next_range(self):
+        """Moves on to the next range and draws a fresh permutation for it."""
+        try:
+            self.start, self.size = next(self.ranges)
+        except StopIteration:
+            raise ValueError("All replacement values of this allocator have been used.")
+        self.step = self.rng.randrange(1, self.size) if self.size > 1 else 1
+        while math.gcd(self.step, self.size) != 1:
+            self.step += 1
+        self.offset = self.rng.randrange(self.size)
+        self.index = 0
+
+def word_ranges():
+    """Yields the ranges of 4-digit, then 5-digit, 6-digit... numbers used for 'word_N' replacements."""
+    for width in itertools.count(4):
+        yield 10 ** (width - 1), 9 * 10 ** (width - 1)
+
+def ip_ranges():
+    """Returns the range of indexes of the IPs handed out as replacements, see generate_ip_replacement."""
+    return [(0, IP_SPACE_SIZE)]
+
+def port_ranges():
+    """Returns the range of non-privileged ports handed out as replacements."""
+    return [(PORT_RANGE_START, PORT_RANGE_SIZE)]
+
+def replace_word(anonymizer, token_type, token):
+    """Replacement generator of the built-in 'word' rule: 'word_XXXX'."""
+    return anonymizer.generate_word_replacement(token)
+
+def replace_ip(anonymizer, token_type, token):
+    """Replacement generator of the built-in 'ip' rule: an IP absent from the original content."""
+    # Record the original first so it is never handed out as a replacement from now on
+    anonymizer.existing_ips.add(token)
+    return anonymizer.generate_ip_replacement()
+
+def replace_port(anonymizer, token_type, token):
+    """Replacement generator of the built-in 'port' rule: ':' and a port absent from the original content."""
+    anonymizer.existing_ports.add(token[1:])
+    return ":" + anonymizer.generate_port_replacement()
+
+class TemplateReplacement:
+    """
+    Replacement generator of the rules loaded from a config file: formats a str.format template whose
+    only field is n, a unique number drawn from the rule's allocator, e.g. "user_{n}@example.com" or
+    "{n:032x}". A plain class rather than a closure, so that rules can be sent to batch worker processes.
+    """
+
+    def __init__(self, template):
+        """:param template: The template of the replacements, with at least one {n} field."""
+        fields = [field for _, field, _, _ in string.Formatter().parse(template) if field is not None]
+        if not fields or any(field != 'n' for field in fields):
+            raise ValueError(f"Replacement template '{template}' must contain {{n}} and no other field.")
+        self.template = template
+
+    def __call__(self, anonymizer, token_type, token):
+        return self.template.format(n=anonymizer.allocators[token_type].allocate())
+
+    def pattern(self):
+        """Returns a regex matching every replacement the template can produce, used for decryption."""
+        parts = []
+        for literal, field, spec, _ in string.Formatter().parse(self.template):
+            parts.append(re.escape(literal))
+            if field is not None:
+                kind = spec[-1:] if spec else ''
+                parts.append({'x': '[0-9a-f]+', 'X': '[0-9A-F]+', 'o': '[0-7]+', 'b': '[01]+'}.get(kind, r'\d+'))
+        return ''.join(parts)
+
+class AnonymizationRule:
+    """
+    One kind of token to anonymize: the regex finding it in the original content, its priority over the
+    other rules, the generator of its replacements and the regex finding those replacements again for
+    decryption. The rule name is the token type recorded with every mapping.
+    """
+
+    def __init__(self, name, pattern, generator, replacement_pattern, priority=0, ranges=word_ranges):
+        """
+        :param name: The token type, a Python identifier, e.g. 'ip'.
+        :param pattern: The regex of the tokens. It must not define named groups of its own.
+        :param generator: Callable (anonymizer, token_type, token) -> a new unique replacement.
+        :param replacement_pattern: The regex matching every replacement the generator can produce.
+        :param priority: Rules with a higher priority are tried first at a given position.
+        :param ranges: Function returning the (start, size) ranges the rule's allocator draws from.
+        """
+        if not name.isidentifier():
+            raise ValueError(f"Rule name '{name}' must be a valid identifier.")
+        try:
+            compiled = re.compile(pattern)
+            re.compile(replacement_pattern)
+        except re.error as e:
+            raise ValueError(f"Invalid pattern in rule '{name}': {e}")
+        if compiled.groupindex:
+            raise ValueError(f"The pattern of rule '{name}' must not define named groups.")
+        self.name = name
+        self.pattern = pattern
+        self.generator = generator
+        self.replacement_pattern = replacement_pattern
+        self.priority = priority
+        self.ranges = ranges
+
+class RuleSet:
+    """
+    The rules of an Anonymizer, compiled into one regex alternating a named group per rule, in order of
+    decreasing priority. Encryption scans the content once whatever the number of rules and dispatches on
+    the name of the group that matched; decryption likewise scans once for the replacements of every rule.
+    """
+
+    def __init__(self, rules):
+        """
+        :param rules: The AnonymizationRule instances. Mappings are saved in this order, and rules of equal
+                      priority are tried in this order.
+        """
+        self.rules = list(rules)
+        self.by_name = {}
+        for rule in self.rules:
+            if rule.name in self.by_name:
+                raise ValueError(f"Duplicate anonymization rule '{rule.name}'.")
+            self.by_name[rule.name] = rule
+        if not self.rules:
+            raise ValueError("At least one anonymization rule is required.")
+        by_priority = sorted(self.rules, key=lambda rule: -rule.priority)
+        self.token_pattern = re.compile('|'.join(f'(?P<{rule.name}>{rule.pattern})' for rule in by_priority))
+        self.decrypt_pattern = re.compile('|'.join(f'(?:{rule.replacement_pattern})' for rule in by_priority))
+
+    def create_allocators(self, seed=None):
+        """Creates an allocator per rule, each seeded separately so their sequences are independent."""
+        return {rule.name: TokenAllocator(rule.ranges(), None if seed is None else f"{seed}-{rule.name}")
+                for rule in self.rules}
+
+# Built-in rules. A colon directly followed by an IP is left to the IP rule, so the first octet is never
+# mistaken for a port. Ports are only restored when followed by a space, as they always have been.
+DEFAULT_RULES = (
+    AnonymizationRule('word', WORD_PATTERN, replace_word, r'word_\d+', priority=10),
+    AnonymizationRule('ip', IP_PATTERN, replace_ip, r'(?:[0-9]{1,3}\.){3}[0-9]{1,3}', priority=30, ranges=ip_ranges),
+    AnonymizationRule('port', r':(?!(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b)\b\d{1,5}\b', replace_port, r':\d{1,5}(?= )',
+                      priority=20, ranges=port_ranges),
+)
+DEFAULT_RULE_SET = RuleSet(DEFAULT_RULES)
+
+# Single tokenizer classifying words, IPs, and ports in one scan, and its decryption counterpart matching
+# every replacement token emitted by encrypt_content
+TOKEN_PATTERN = DEFAULT_RULE_SET.token_pattern
+DECRYPT_PATTERN = DEFAULT_RULE_SET.decrypt_pattern
+
+def load_rules(config_path):
+    """
+    Loads the anonymization rules from a JSON config file of the form:
+        {
+            "disable": ["word"],
+            "rules": [
+                {"name": "email", "pattern": "...", "priority": 40, "replacement": "user_{n}@example.com"}
+            ]
+        }
+    The rules are added to the built-in ip, port and word rules, except those listed in "disable"; a rule
+    named after a built-in one replaces it. "replacement_pattern" may be given when the regex derived from
+    the replacement template is not specific enough.
+
+    :param config_path: The path to the config file.
+    :return: The RuleSet.
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    rules = {rule.name: rule for rule in DEFAULT_RULES}
+    for name in config.get('disable', []):
+        if name not in rules:
+            raise ValueError(f"Cannot disable unknown built-in rule '{name}'.")
+        del rules[name]
+    for definition in config.get('rules', []):
+        missing = [key for key in ('name', 'pattern', 'replacement') if key not in definition]
+        if missing:
+            raise ValueError(f"Anonymization rule {definition} is missing: {', '.join(missing)}")
+        generator = TemplateReplacement(definition['replacement'])
+        rules[definition['name']] = AnonymizationRule(
+            definition['name'], definition['pattern'], generator,
+            definition.get('replacement_pattern', generator.pattern()), priority=definition.get('priority', 0))
+    return RuleSet(rules.values())
+
+class MappingStore:
+    """
+    Persistent mapping store backed by sqlite3, so one consistent mapping can be reused across many files
+    and runs. Mappings are only ever appended, and lookups by original or by replacement go through
+    indexes, so the store is never loaded into memory as a whole. The allocator seed and the number of
+    values drawn from each allocator are kept alongside, so later runs never hand out a replacement twice.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS mappings (
+            original TEXT NOT NULL,
+            replacement TEXT NOT NULL,
+            type TEXT NOT NULL,
+            PRIMARY KEY (type, original)
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS mappings_replacement ON mappings (replacement);
+        CREATE TABLE IF NOT EXISTS metadata (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, store_path):
+        """:param store_path: Path to the sqlite database, created on first use."""
+        self.store_path = store_path
+        self.connection = sqlite3.connect(store_path)
+        self.connection.executescript(self.SCHEMA)
+
+    def find_replacement(self, token_type, original):
+        """Returns the stored replacement of original, or None if it was never mapped."""
+        row = self.connection.execute(
+            "SELECT replacement FROM mappings WHERE type = ? AND original = ?", (token_type, original)
+        ).fetchone()
+        return row[0] if row else None
+
+    def find_original(self, replacement):
+        """Returns the original value mapped to replacement, or None if no token was replaced by it."""
+        row = self.connection.execute(
+            "SELECT original FROM mappings WHERE replacement = ?", (replacement,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def add(self, token_type, original, replacement):
+        """Appends a new mapping. It becomes durable on the next commit()."""
+        self.connection.execute(
+            "INSERT INTO mappings (original, replacement, type) VALUES (?, ?, ?)",
+            (original, replacement, token_type)
+        )
+
+    def get_metadata(self, key, default=None):
+        """Returns a stored metadata value such as the allocator seed, or default if it is not set."""
+        row = self.connection.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_metadata(self, key, value):
+        """Stores a metadata value, replacing any previous one."""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)", (key, str(value))
+        )
+
+    def commit(self):
+        """Makes all mappings added since the last commit durable."""
+        self.connection.commit()
+
+    def close(self):
+        """Commits pending mappings and closes the database."""
+        self.commit()
+        self.connection.close()
+
+class Anonymizer:
+    """
+    Owns the whole encryption state of one anonymization context: the rules finding the tokens to replace
+    (words, IPs and ports by default), their mappings, the allocators handing out replacements and an
+    optional persistent mapping store. Instances are fully
+    independent, so any number of them can live in one process; sharing one instance keeps a single
+    consistent mapping across many files or calls.
+
+    The encrypt and decrypt methods accept a str, bytes-like data such as bytes or an mmap (non-UTF-8 bytes
+    pass through unchanged) or an iterable of lines, and return the same kind of value (bytes for bytes-like
+    data).
+
+    Usage:
+        anonymizer = Anonymizer(seed=42)
+        encrypted = anonymizer.encrypt("Server IP: 192.168.1.1")
+        for line in anonymizer.encrypt(open("app.log")):
+            ...
+        anonymizer.decrypt(encrypted)  # -> "Server IP: 192.168.1.1"
+    """
+
+    def __init__(self, seed=None, store_path=None, rules=None):
+        """
+        :param seed: Optional seed making the generated replacements reproducible.
+        :param store_path: Optional path to a persistent sqlite mapping store. The allocators are then restored
+            from the seed saved in the store (seed only applies to a new store) and fast-forwarded past every
+            value already handed out, so new replacements never clash with stored ones.
+        :param rules: Optional RuleSet, see load_rules. Defaults to the built-in word, IP and port rules.
+        """
+        self.rules = rules if rules is not None else DEFAULT_RULE_SET
+        self.mapping_store = MappingStore(store_path) if store_path else None
+        if self.mapping_store is not None:
+            stored_seed = self.mapping_store.get_metadata('seed')
+            if stored_seed is None:
+                stored_seed = str(seed if seed is not None else random.randrange(2 ** 63))
+                self.mapping_store.set_metadata('seed', stored_seed)
+            seed = stored_seed
+
+        # Allocators handing out unique replacement values, one per rule
+        self.allocators = self.rules.create_allocators(seed)
+        if self.mapping_store is not None:
+            for token_type, allocator in self.allocators.items():
+                allocator.advance(int(self.mapping_store.get_metadata(f'{token_type}_allocated', 0)))
+
+        # Sets to keep track of existing ports and IPs in the original content
+        self.existing_ips = set()
+        self.existing_ports = set()
+
+        # Dictionaries to store mappings of original to replacement values for every token type, plus the
+        # inverted table used for decryption. With a mapping store they only cache the tokens met so far.
+        self.type_mappings = {rule.name: {} for rule in self.rules.rules}
+        self.reverse_mapping = {}
+
+    def encrypt(self, content):
+        """
+        Replaces every word, IP, and port in content with its substitute, generating new ones as needed.
+        All tokens are classified and substituted in a single scan, so replacement tokens are never re-matched.
+        """
+        if isinstance(content, str):
+            return self.rules.token_pattern.sub(self.replace_token, content)
+        if isinstance(content, BYTES_LIKE):
+            return self.encrypt(str(content, 'utf-8', 'surrogateescape')).encode('utf-8', 'surrogateescape')
+        return (self.encrypt(line) for line in content)
+
+    def decrypt(self, content):
+        """Restores every replacement token in content to its original value, in a single scan."""
+        if isinstance(content, str):
+            return self.rules.decrypt_pattern.sub(self.restore_token, content)
+        if isinstance(content, BYTES_LIKE):
+            return self.decrypt(str(content, 'utf-8', 'surrogateescape')).encode('utf-8', 'surrogateescape')
+        return (self.decrypt(line) for line in content)
+
+    def replace_token(self, match):
+        """Returns the substitute of a single token pattern match, dispatching on the rule that matched."""
+        token = match.group(0)
+        replacement = self.type_mappings[match.lastgroup].get(token)
+        if replacement is None:
+            replacement = self.find_or_create_replacement(match.lastgroup, token)
+            self.add_mapping(match.lastgroup, token, replacement)
+        return replacement
 
-# Dictionaries to store mappings of original to replacement values for words, IPs, and ports
-word_mapping = {}
-ip_mapping = {}
-port_mapping = {}
+    def restore_token(self, match):
+        """
+        Returns the original value of a single decrypt pattern match. With a mapping store, tokens are looked
+        up by replacement on first sight and cached; tokens without a mapping are left unchanged.
+        """
+        token = match.group(0)
+        original = self.reverse_mapping.get(token)
+        if original is None:
+            if self.mapping_store is None:
+                return token
+            original = self.reverse_mapping[token] = self.mapping_store.find_original(token) or token
+        return original
+
+    def find_or_create_replacement(self, token_type, token):
+        """
+        Returns the replacement of a token missing from the in-memory mappings: the one recorded in the mapping
+        store if there is one, otherwise a new replacement from the generator of the token's rule, which is
+        appended to the store.
+        """
+        if self.mapping_store is not None:
+            replacement = self.mapping_store.find_replacement(token_type, token)
+            if replacement is not None:
+                return replacement
+
+        generator = self.rules.by_name[token_type].generator
+        while True:
+            replacement = generator(self, token_type, token)
+
+            # Replacements written by a differently seeded run may already be taken in the store
+            if self.mapping_store is None:
+                return replacement
+            if self.mapping_store.find_original(replacement) is None:
+                self.mapping_store.add(token_type, token, replacement)
+                return replacement
+
+    def add_mapping(self, token_type, original, replacement):
+        """Records a mapping in the in-memory tables used by both encryption and decryption."""
+        self.type_mappings[token_type][original] = replacement
+        self.reverse_mapping[replacement] = original
+
+    def generate_word_replacement(self, word):
+        """
+        Generates a unique replacement word in the format 'word_XXXX'. Once all 4-digit names are used the
+        width grows to 'word_XXXXX' and so on, so the pool never runs out.
+        """
+        return f"word_{self.allocators['word'].allocate()}"
+
+    def generate_ip_replacement(self):
+        """
+        Generates a unique IP address for replacement, ensuring it is not already used or in the original
+        content, as recorded by reserve_originals.
+        """
+        while True:
+            # Every allocated index is unique, only IPs present in the original content need to be skipped
+            index = self.allocators['ip'].allocate()
+            ip = f"{index // 255 ** 3 % 255 + 1}.{index // 255 ** 2 % 255 + 1}.{index // 255 % 255 + 1}.{index % 255 + 1}"
+            if ip not in self.existing_ips:
+                return ip
+
+    def generate_port_replacement(self):
+        """
+        Generates a unique port for replacement, ensuring it is not already used or in the original content,
+        as recorded by reserve_originals.
+        """
+        while True:
+            # Every allocated port is unique, only ports present in the original content need to be skipped
+            port = str(self.allocators['port'].allocate())
+            if port not in self.existing_ports:
+                return port
+
+    def reserve_originals(self, content):
+        """
+        Records every IP and port of content in existing_ips and existing_ports, so that none of them is handed
+        out as a replacement. encrypt only records the originals it meets, so a replacement could otherwise be
+        an original appearing later in the input, which the output would not tell apart. The encryption
+        functions call this on their whole input before encrypting it.
+
+        :param content: A str, bytes-like data or an iterable of lines, as for encrypt.
+        """
+        if isinstance(content, BYTES_LIKE):
+            content = str(content, 'utf-8', 'surrogateescape')
+        if isinstance(content, str):
+            self.existing_ips.update(re.findall(IP_PATTERN, content))
+            # Strip the leading colon of the ports
+            self.existing_ports.update(match[1:] for match in re.findall(PORT_PATTERN, content))
+            return
+        for line in content:
+            self.reserve_originals(line)
+
+    def extract_existing_ips(self, file_path):
+        """
+        Extracts all IPs from the input file and stores them in existing_ips to avoid duplicates in replacements.
+        See reserve_originals, which records the ports too.
+        """
+        for line in iter_file_lines(file_path):
+            self.existing_ips.update(re.findall(IP_PATTERN, line))
+
+    def extract_existing_ports(self, file_path):
+        """
+        Extracts all ports from the input file and stores them in existing_ports to avoid duplicates in replacements.
+        See reserve_originals, which records the IPs too.
+        """
+        for line in iter_file_lines(file_path):
+            # Strip the leading colon and add to the existing_ports set
+            self.existing_ports.update(match[1:] for match in re.findall(PORT_PATTERN, line))
+
+    def save_mappings(self, mappings_file_path):
+        """Commits new mappings to the mapping store if there is one, otherwise rewrites the mappings CSV file."""
+        if self.mapping_store is not None:
+            self.mapping_store.commit()
+        else:
+            self.save_mappings_to_csv(mappings_file_path)
+
+    def save_mappings_to_csv(self, mappings_file_path):
+        """Saves the mappings of original values to replacements in a CSV file for future decryption."""
+        # surrogateescape keeps the non-UTF-8 bytes of tokens met in binary mode
+        with open(mappings_file_path, 'w', newline='', errors='surrogateescape') as csvfile:
+            fieldnames = ['original', 'replacement', 'type']
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+
+            writer.writeheader()
+
+            # Write the mappings of every token type
+            for token_type, mapping in self.type_mappings.items():
+                for original, replacement in mapping.items():
+                    writer.writerow({'original': original, 'replacement': replacement, 'type': token_type})
+
+    def load_mappings_from_csv(self, mappings_file_path):
+        """
+        Loads mappings from a CSV file to restore the original values for decryption. Mappings of token types
+        without a rule in this Anonymizer are skipped, so decrypting needs the rules used to encrypt.
+        """
+        with open(mappings_file_path, 'r', errors='surrogateescape') as csvfile:
+            reader = csv.DictReader(csvfile)
+            for row in reader:
+                if row['type'] in self.type_mappings:
+                    self.add_mapping(row['type'], row['original'], row['replacement'])
+
+    def close(self):
+        """Saves the allocator positions, commits the new mappings and closes the mapping store, if any."""
+        if self.mapping_store is None:
+            return
+        for token_type, allocator in self.allocators.items():
+            self.mapping_store.set_metadata(f'{token_type}_allocated', allocator.allocated)
+        self.mapping_store.close()
+        self.mapping_store = None
+
+# Anonymizer of a batch worker process, set up by init_batch_worker
+worker_anonymizer = None
 
 def main():
     """
@@ -64,159 +611,334 @@ def main():
     group.add_argument("-d", "--decrypt", action="store_true", help="Decrypt the input file.")
     parser.add_argument("input_file", help="Path to the input file to encrypt.")
     parser.add_argument("output_file", help="Path to the output file for encrypted content.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Process the input line by line instead of loading it into memory.")
+    parser.add_argument("--binary", action="store_true",
+                        help="Process the input as bytes through mmap, passing non-UTF-8 bytes through (constant memory).")
+    parser.add_argument("--seed", type=int, help="Seed making the generated replacements reproducible.")
+    parser.add_argument("--store", help="Path to a persistent sqlite mapping store reused across files and "
+                                        "runs, instead of the mappings.csv next to the input file.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Treat input_file as a directory or glob and output_file as the output directory.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Number of processes used in batch mode (default: number of CPUs).")
+    parser.add_argument("--rules", help="JSON file of extra anonymization rules (e.g. emails, UUIDs), see "
+                                        "anonymization_rules.json. Decryption needs the rules used to encrypt.")
+    add_instrumentation_arguments(parser, quiet=False)
     
     args = parser.parse_args()
 
-    # Extract the directory of the input file and set mapping file path
-    input_dir = os.path.dirname(args.input_file)
-    mapping_file = os.path.join(input_dir, 'mappings.csv')
+    if args.binary and (args.stream or args.batch):
+        parser.error("--binary cannot be combined with --stream or --batch")
+    rules = load_rules(args.rules) if args.rules else None
+    anonymizer = Anonymizer(seed=args.seed, store_path=args.store, rules=rules)
+    if args.store:
+        # The store keeps its own mappings, so no mappings.csv is read or written
+        mapping_file = None
+    else:
+        # Extract the directory of the input file and set mapping file path
+        input_dir = get_batch_root(args.input_file) if args.batch else os.path.dirname(args.input_file)
+        mapping_file = os.path.join(input_dir, 'mappings.csv')
     
+    # Stages are only timed when asked for, as timing every line of a stream has a cost
+    stats = RunStats(unit="lines" if args.stream else "files", timed=args.stats)
+
     # Perform encryption or decryption based on the mode
-    if args.encrypt:
-        # Encrypt the content of the specified input file and save it to the specified output file
-        encrypt_content(args.input_file, args.output_file, mapping_file)
-    elif args.decrypt:
-        decrypt_content(args.input_file, mapping_file, args.output_file)
-
-def generate_word_replacement(word):
-    """Generates a unique replacement word in the format 'word_XXXX', ensuring it is not already used."""
-    while True:
-        # Generate a random word
-        word = f"word_{random.randint(1000, 9999)}"
-        # Ensure it's unique and not in the existing ports
-        if word not in used_words:
-            used_words.add(word)
-            return word
-
-def generate_ip_replacement():
-    """Generates a unique IP address for replacement, ensuring it is not already used or in the original file."""
-    while True:
-        # Generate a random port within the valid range
-        ip = f"{random.randint(1, 255)}.{random.randint(1, 255)}.{random.randint(1, 255)}.{random.randint(1, 255)}"
-        # Ensure it's unique and not in the existing ports
-        if ip not in used_ips and ip not in existing_ips:
-            used_ips.add(ip)
-            return ip
-
-def generate_port_replacement():
-    """Generates a unique port for replacement, ensuring it is not already used or in the original file."""
-    while True:
-        # Generate a random port within the valid range
-        port = str(random.randint(1024, 65535))
-        # Ensure it's unique and not in the existing ports
-        if port not in used_ports and port not in existing_ports:
-            used_ports.add(port)
-            return port
-
-def extract_existing_ips(file_path):
-    """Extracts all IPs from the input file and stores them in existing_ips to avoid duplicates in replacements."""
-    with open(file_path, 'r') as f:
-        content = f.read()
-        matches = re.findall(IP_PATTERN, content)
-        for match in matches:
-            existing_ips.add(match)
-
-def extract_existing_ports(file_path):
-    """Extracts all ports from the input file and stores them in existing_ports to avoid duplicates in replacements."""
-    with open(file_path, 'r') as f:
-        content = f.read()
-        matches = re.findall(PORT_PATTERN, content)
-        # Strip the leading colon and add to the existing_ports set
-        for match in matches:
-            port = match[1:]  # Remove the leading colon
-            existing_ports.add(port)
-
-def encrypt_content(file_path, output_file, mappings_file_path):
+    with profiled(args.profile, args.profile_output):
+        if args.batch:
+            if args.encrypt:
+                encrypt_batch(args.input_file, args.output_file, mapping_file, args.workers, anonymizer, stats)
+            else:
+                decrypt_batch(args.input_file, args.output_file, mapping_file, args.workers, anonymizer, stats)
+        elif args.encrypt:
+            # Encrypt the content of the specified input file and save it to the specified output file
+            if args.stream:
+                encrypt_content_stream(args.input_file, args.output_file, mapping_file, anonymizer, stats)
+            else:
+                encrypt_content(args.input_file, args.output_file, mapping_file, anonymizer, stats, args.binary)
+        elif args.decrypt:
+            if args.stream:
+                decrypt_content_stream(args.input_file, mapping_file, args.output_file, anonymizer, stats)
+            else:
+                decrypt_content(args.input_file, mapping_file, args.output_file, anonymizer, stats, args.binary)
+
+    anonymizer.close()
+    if args.stats:
+        print(stats.report(), file=sys.stderr)
+
+def encrypt_content(file_path, output_file, mappings_file_path, anonymizer=None, stats=None, binary=False):
     """
     Encrypts the content of the input file by replacing each word, IP, and port with a unique substitute.
-    Saves the encrypted content to the output file.
-    """
-
-    # Extract existing IPs and ports from the file to avoid collisions in replacements
-    extract_existing_ports(file_path)
-    extract_existing_ips(file_path)
-
-    with open(file_path, 'r') as f:
-        content = f.read()
-        
-        # Replace each unique word with a generated replacement word
-        content = re.sub(WORD_PATTERN, lambda match: word_mapping.setdefault(
-            match.group(0), generate_word_replacement(match.group(0))
-        ), content)
-        
-        # Replace each unique IP with a generated replacement IP
-        content = re.sub(IP_PATTERN, lambda match: ip_mapping.setdefault(
-            match.group(0), generate_ip_replacement()
-        ), content)
-        
-        # Replace each unique port with a generated replacement port
-        content = re.sub(PORT_PATTERN, lambda match: port_mapping.setdefault(
-            match.group(0), ":" + generate_port_replacement()
-        ), content)
+    Saves the encrypted content to the output file. A fresh Anonymizer is used unless one is given, so
+    mappings never leak from one call into the next. An optional RunStats times the read, transform,
+    mappings and write stages. With binary, the file is processed as bytes, see substitute_mapped_file.
+    """
+    anonymizer = anonymizer if anonymizer is not None else Anonymizer()
+    stats = stats if stats is not None else RunStats(timed=False)
+
+    if binary:
+        with stats.stage("collect", nbytes=os.path.getsize(file_path)), open_mmap(file_path) as data:
+            for start, end in split_file_ranges(file_path, BINARY_CHUNK_SIZE):
+                anonymizer.reserve_originals(data[start:end])
+        substitute_mapped_file(file_path, output_file, anonymizer.encrypt, stats)
+        with stats.stage("mappings"):
+            anonymizer.save_mappings(mappings_file_path)
+        stats.progress()
+        return
+
+    with stats.stage("read", items=1):
+        content = read_text(file_path)
+        stats.add("read", nbytes=len(content))
+    with stats.stage("collect", nbytes=len(content)):
+        anonymizer.reserve_originals(content)
+    with stats.stage("transform", items=1, nbytes=len(content)):
+        content = anonymizer.encrypt(content)
     
     # Save mappings to a CSV file to preserve the replacement data for decryption
-    save_mappings_to_csv(mappings_file_path)
+    with stats.stage("mappings"):
+        anonymizer.save_mappings(mappings_file_path)
     
     # Write the encrypted content to the specified output file
-    with open(output_file, 'w') as f:
+    with stats.stage("write", items=1, nbytes=len(content)), open_buffered_writer(output_file) as f:
         f.write(content)
+    stats.progress()
+
+def encrypt_content_stream(file_path, output_file, mappings_file_path, anonymizer=None, stats=None):
+    """
+    Streaming variant of encrypt_content for files too large to hold in memory.
+    The input is read line by line and each encrypted line is written out immediately, so only the
+    mapping tables stay in memory. Words, IPs, and ports never span a line break, so the substitutions
+    are the same as the in-memory path. The IPs and ports of the file are first collected in a separate
+    pass, see Anonymizer.reserve_originals.
+    """
+    anonymizer = anonymizer if anonymizer is not None else Anonymizer()
+    stats = stats if stats is not None else RunStats(timed=False)
+    with stats.stage("collect", nbytes=os.path.getsize(file_path)):
+        anonymizer.reserve_originals(iter_file_lines(file_path))
+    substitute_file_lines(file_path, output_file, anonymizer.encrypt, stats)
+
+    # Save mappings to a CSV file to preserve the replacement data for decryption
+    with stats.stage("mappings"):
+        anonymizer.save_mappings(mappings_file_path)
 
-def save_mappings_to_csv(mappings_file_path):
-    """Saves the mappings of original values to replacements in a CSV file for future decryption."""
-    with open(mappings_file_path, 'w', newline='') as csvfile:
-        fieldnames = ['original', 'replacement', 'type']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        
-        # Write word mappings
-        for original, replacement in word_mapping.items():
-            writer.writerow({'original': original, 'replacement': replacement, 'type': 'word'})
-        
-        # Write IP mappings
-        for original, replacement in ip_mapping.items():
-            writer.writerow({'original': original, 'replacement': replacement, 'type': 'ip'})
-        
-        # Write port mappings
-        for original, replacement in port_mapping.items():
-            writer.writerow({'original': original, 'replacement': replacement, 'type': 'port'})
-
-def decrypt_content(encrypted_file_path, mappings_file_path, decrypted_file):
+def decrypt_content(encrypted_file_path, mappings_file_path, decrypted_file, anonymizer=None, stats=None,
+                    binary=False):
     """
     Decrypts the encrypted content by reversing replacements based on mappings stored in the CSV file.
-    Writes the decrypted content to a new file decrypted_file.
+    Writes the decrypted content to a new file decrypted_file. An optional RunStats times the mappings,
+    read, transform and write stages. With binary, the file is processed as bytes, see substitute_mapped_file.
     """
-    
-    # Load the mappings from CSV to reverse the encryption process
-    load_mappings_from_csv(mappings_file_path)
-    
-    with open(encrypted_file_path, 'r') as f:
-        content = f.read()
-        
-        # Reverse replacements for words, IPs, and ports based on stored mappings
-        for replacement, original in {v: k for k, v in word_mapping.items()}.items():
-            content = content.replace(replacement, original)
-        for replacement, original in {v: k for k, v in ip_mapping.items()}.items():
-            content = content.replace(replacement, original)
-        for replacement, original in {v: k for k, v in port_mapping.items()}.items():
-            content = content.replace(replacement + " ", original + " ")
+    anonymizer = anonymizer if anonymizer is not None else Anonymizer()
+    stats = stats if stats is not None else RunStats(timed=False)
+
+    # Load the mappings from CSV to reverse the encryption process, unless a mapping store is used
+    if anonymizer.mapping_store is None:
+        with stats.stage("mappings"):
+            anonymizer.load_mappings_from_csv(mappings_file_path)
+
+    if binary:
+        substitute_mapped_file(encrypted_file_path, decrypted_file, anonymizer.decrypt, stats)
+        stats.progress()
+        return
+
+    # Reverse replacements for words, IPs, and ports in one scan over the content
+    with stats.stage("read", items=1):
+        content = read_text(encrypted_file_path)
+        stats.add("read", nbytes=len(content))
+    with stats.stage("transform", items=1, nbytes=len(content)):
+        content = anonymizer.decrypt(content)
     
     # Write the decrypted content to a new file
-    with open(decrypted_file, 'w') as f:
+    with stats.stage("write", items=1, nbytes=len(content)), open_buffered_writer(decrypted_file) as f:
         f.write(content)
+    stats.progress()
+
+def decrypt_content_stream(encrypted_file_path, mappings_file_path, decrypted_file, anonymizer=None, stats=None):
+    """
+    Streaming variant of decrypt_content that restores the encrypted file line by line, writing each
+    decrypted line out immediately instead of holding the whole file in memory.
+    """
+    anonymizer = anonymizer if anonymizer is not None else Anonymizer()
+    stats = stats if stats is not None else RunStats(timed=False)
+    if anonymizer.mapping_store is None:
+        with stats.stage("mappings"):
+            anonymizer.load_mappings_from_csv(mappings_file_path)
+    substitute_file_lines(encrypted_file_path, decrypted_file, anonymizer.decrypt, stats)
+
+def substitute_file_lines(input_file, output_file, substitute, stats=None):
+    """
+    Streams input_file line by line through substitute, writing each resulting line to output_file.
+    With a timed RunStats, every line is timed in the read, transform and write stages, which slows the loop
+    down, so the plain loop is used otherwise.
+    """
+    with open(input_file, 'r') as src, open_buffered_writer(output_file) as dst:
+        if stats is None or not stats.timed:
+            for line in src:
+                dst.write(substitute(line))
+            return
+        for line in stats.timed_iter("read", src, len):
+            with stats.stage("transform", nbytes=len(line)):
+                line = substitute(line)
+            with stats.stage("write", nbytes=len(line)):
+                dst.write(line)
+            stats.progress()
+
+def substitute_mapped_file(input_file, output_file, substitute, stats=None, chunk_size=BINARY_CHUNK_SIZE):
+    """
+    Binary variant of substitute_file_lines: maps input_file in memory and passes it through substitute
+    as bytes, in chunks of about chunk_size bytes of whole lines, each written out as soon as it is
+    substituted. The Anonymizer decodes a chunk with surrogateescape, so files in any or mixed encodings are
+    processed and their non-UTF-8 bytes written back unchanged, and only a chunk and its substitute are held
+    in memory besides the mappings. Like --stream, this relies on tokens never spanning a line break, which
+    also keeps every multi-byte character within a chunk.
+    """
+    stats = stats if stats is not None else RunStats(timed=False)
+    with open_mmap(input_file) as data, open_buffered_writer(output_file, "wb") as dst:
+        for start, end in split_file_ranges(input_file, chunk_size):
+            with stats.stage("read", nbytes=end - start):
+                chunk = data[start:end]
+            with stats.stage("transform", nbytes=len(chunk)):
+                chunk = substitute(chunk)
+            with stats.stage("write", nbytes=len(chunk)):
+                dst.write(chunk)
+
+def get_batch_root(input_path):
+    """Returns the directory a batch input is relative to: the directory itself, or the fixed part of a glob."""
+    if os.path.isdir(input_path):
+        return input_path
+    wildcard = min((i for i in (input_path.find(c) for c in '*?[') if i >= 0), default=len(input_path))
+    return os.path.dirname(input_path[:wildcard])
+
+def list_batch_files(input_path):
+    """
+    Lists the files of a batch input, which is either a directory (walked recursively) or a glob pattern.
+    Mapping files are skipped so they are never anonymized themselves. The order is sorted and stable.
+    """
+    return [file for file in list_input_files(input_path) if os.path.basename(file) != 'mappings.csv']
+
+def get_batch_jobs(input_path, output_dir):
+    """Pairs every batch input file with its output path, mirroring the layout below the batch root."""
+    root = get_batch_root(input_path)
+    jobs = []
+    for file in list_batch_files(input_path):
+        output_file = os.path.join(output_dir, os.path.relpath(file, root))
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        jobs.append((file, output_file))
+    return jobs
+
+def run_batch(function, items, workers, anonymizer, initargs):
+    """
+    Yields function(item) for every item in input order. With more than one worker the items are spread over
+    a process pool whose workers are set up by init_batch_worker(*initargs); otherwise anonymizer is used inline.
+    """
+    global worker_anonymizer
+    if workers <= 1:
+        worker_anonymizer = anonymizer
+        yield from map(function, items)
+        return
+
+    # Workers must not inherit an open transaction of the mapping store
+    if anonymizer.mapping_store is not None:
+        anonymizer.mapping_store.commit()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker, initargs=initargs) as executor:
+        yield from executor.map(function, items)
+
+def init_batch_worker(mappings, store_path=None, rules=None):
+    """
+    Sets up the Anonymizer of a batch worker process with the shared mappings, optional mapping store and
+    the rules of the parent's Anonymizer.
+    """
+    global worker_anonymizer
+    worker_anonymizer = Anonymizer(store_path=store_path, rules=rules)
+    for token_type, mapping in mappings.items():
+        for original, replacement in mapping.items():
+            worker_anonymizer.add_mapping(token_type, original, replacement)
+
+def collect_file_tokens(file_path):
+    """Returns the distinct (type, token) pairs of a file in order of first appearance, reading it line by line."""
+    tokens = {}
+    for line in iter_file_lines(file_path):
+        for match in worker_anonymizer.rules.token_pattern.finditer(line):
+            tokens.setdefault((match.lastgroup, match.group(0)), None)
+    return list(tokens)
+
+def encrypt_batch_file(job):
+    """Encrypts one batch file with the shared mappings; every token was already mapped in the collect phase."""
+    file_path, output_file = job
+    substitute_file_lines(file_path, output_file, worker_anonymizer.encrypt)
+    return output_file
+
+def decrypt_batch_file(job):
+    """Decrypts one batch file with the shared mappings."""
+    encrypted_file_path, decrypted_file = job
+    substitute_file_lines(encrypted_file_path, decrypted_file, worker_anonymizer.decrypt)
+    return decrypted_file
+
+def encrypt_batch(input_path, output_dir, mappings_file_path, workers=None, anonymizer=None, stats=None):
+    """
+    Encrypts every file of a directory or glob into output_dir with one mapping shared by all files.
+    Runs in two phases so no allocator has to be shared between processes:
+    1. The workers collect the distinct tokens of each file in parallel.
+    2. The parent reserves the IPs and ports of all files (see Anonymizer.reserve_originals) and assigns
+       replacements to new tokens in file order, then the workers substitute every file in parallel using
+       the complete mapping.
+    The result is the same as encrypting the files one after the other with the same seed, except that no
+    replacement is an IP or port of any of the files, rather than of the file being encrypted.
+    Without a mapping store, the mappings CSV is also copied into output_dir, where a batch decryption of
+    output_dir looks for it. An optional RunStats times the walk, collect, transform and mappings stages.
+    """
+    workers = workers or os.cpu_count()
+    anonymizer = anonymizer if anonymizer is not None else Anonymizer()
+    stats = stats if stats is not None else RunStats(timed=False)
+    with stats.stage("walk"):
+        jobs = get_batch_jobs(input_path, output_dir)
+    input_size = sum(os.path.getsize(file) for file, _ in jobs)
+
+    with stats.stage("collect", items=len(jobs), nbytes=input_size):
+        # Every file is collected before any replacement is assigned, so none is an original of a later file
+        files_tokens = list(run_batch(collect_file_tokens, [file for file, _ in jobs], workers, anonymizer,
+                                      ({}, None, anonymizer.rules)))
+        for file_tokens in files_tokens:
+            anonymizer.reserve_originals(token for _, token in file_tokens)
+        for file_tokens in files_tokens:
+            for token_type, token in file_tokens:
+                if token not in anonymizer.type_mappings[token_type]:
+                    anonymizer.add_mapping(token_type, token, anonymizer.find_or_create_replacement(token_type, token))
+
+    with stats.stage("transform", items=len(jobs), nbytes=input_size):
+        for _ in run_batch(encrypt_batch_file, jobs, workers, anonymizer,
+                           (anonymizer.type_mappings, None, anonymizer.rules)):
+            stats.progress()
+    with stats.stage("mappings"):
+        anonymizer.save_mappings(mappings_file_path)
+        output_mappings = os.path.join(output_dir, 'mappings.csv')
+        # output_dir only exists yet if a file was written to it
+        os.makedirs(output_dir, exist_ok=True)
+        if anonymizer.mapping_store is None and not os.path.samefile(os.path.dirname(output_mappings),
+                                                                     os.path.dirname(mappings_file_path) or '.'):
+            anonymizer.save_mappings_to_csv(output_mappings)
+
+def decrypt_batch(input_path, output_dir, mappings_file_path, workers=None, anonymizer=None, stats=None):
+    """
+    Decrypts every file of a directory or glob into output_dir across a process pool.
+    An optional RunStats times the mappings, walk and transform stages.
+    """
+    workers = workers or os.cpu_count()
+    anonymizer = anonymizer if anonymizer is not None else Anonymizer()
+    stats = stats if stats is not None else RunStats(timed=False)
+    # Loaded first, so a missing mappings file fails before any output directory is created
+    if anonymizer.mapping_store is None:
+        with stats.stage("mappings"):
+            anonymizer.load_mappings_from_csv(mappings_file_path)
+    with stats.stage("walk"):
+        jobs = get_batch_jobs(input_path, output_dir)
+    input_size = sum(os.path.getsize(file) for file, _ in jobs)
 
-def load_mappings_from_csv(mappings_file_path):
-    """Loads mappings from a CSV file to restore the original values for decryption."""
-
-    with open(mappings_file_path, 'r') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            if row['type'] == 'word':
-                word_mapping[row['original']] = row['replacement']
-            elif row['type'] == 'ip':
-                ip_mapping[row['original']] = row['replacement']
-            elif row['type'] == 'port':
-                port_mapping[row['original']] = row['replacement']
+    store_path = anonymizer.mapping_store.store_path if anonymizer.mapping_store is not None else None
+    with stats.stage("transform", items=len(jobs), nbytes=input_size):
+        for _ in run_batch(decrypt_batch_file, jobs, workers, anonymizer,
+                           (anonymizer.type_mappings, store_path, anonymizer.rules)):
+            stats.progress()
 
 # Run the main function if this script is executed directly
 if __name__ == "__main__":
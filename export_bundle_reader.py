@@ -0,0 +1,242 @@
+"""
+Random-access reader for the bundles written by extract_files_to_text.py.
+
+A bundle is a flat file (or a set of shards) of sections, each made of a "=====" line, the path of an exported
+file, a "-----" line and the content of that file. Every export writes an index next to the bundle
+(`<output>.index.json`) with the byte offset and length of every section. The reader loads the index and
+maps the bundle files with mmap, so listing, extracting or searching one file costs a seek to its section
+instead of a scan of the whole bundle.
+
+Usage:
+    python export_bundle_reader.py out_v1_file.log list
+    python export_bundle_reader.py out_v1_file.log list --path "src/api/*"
+    python export_bundle_reader.py out_v1_file.log cat src/api/app.py
+    python export_bundle_reader.py out_v1_file.log extract "src/api/*" --output-dir restored
+    python export_bundle_reader.py out_v1_file.log grep "TODO|FIXME" --path "*.py"
+    python export_bundle_reader.py out_v1_file.log reindex
+
+The bundle may be given as the exported .log file, as the index itself, or, for sharded exports, as the
+index or the output base (e.g. out_v1_file). "reindex" rebuilds the index of a single-file bundle by
+scanning it, for bundles written before indexes existed or modified by hand.
+
+Functions:
+    - resolve_index_path(bundle): Returns the index path for a bundle, index or output base path.
+    - reindex_bundle(bundle_path): Scans a single-file bundle and writes its index.
+"""
+
+import os
+import re
+import sys
+import json
+import locale
+import fnmatch
+import argparse
+
+from common import io_extender
+from extract_files_to_text import (BUNDLE_INDEX_VERSION, bundle_index_path, has_glob_magic, scan_bundle,
+                                   write_bundle_index)
+
+
+class BundleReader:
+    """
+    Reads the sections of an exported bundle through its index, with each bundle file mapped by mmap.
+    Raises ValueError if the index does not match the bundle files anymore.
+    """
+
+    def __init__(self, index_path):
+        """
+        :param index_path: The path of the index of the bundle.
+        """
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != BUNDLE_INDEX_VERSION:
+            raise ValueError(f"Unsupported index version in '{index_path}', run reindex or export again.")
+
+        folder = os.path.dirname(index_path)
+        self.index_path = index_path
+        self.shard_paths = [os.path.join(folder, shard) for shard in data["shards"]]
+        for path, size in zip(self.shard_paths, data["shard_sizes"]):
+            if not os.path.exists(path) or os.path.getsize(path) != size:
+                raise ValueError(f"Index '{index_path}' does not match '{path}', run reindex or export again.")
+
+        self.entries = data["files"]
+        self.encoding = locale.getpreferredencoding(False)
+        self.entries_by_path = {}
+        for entry in self.entries:
+            # the same path can be exported several times in an appended bundle, the last one wins
+            self.entries_by_path[entry["path"]] = entry
+        self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def list_files(self, pattern=None):
+        """
+        Return the entries of the sections, optionally only those whose path matches a glob pattern.
+
+        :param pattern: Optional glob pattern on the path shown in the section header.
+        """
+        if pattern is None:
+            return list(self.entries)
+        return [entry for entry in self.entries if fnmatch.fnmatchcase(entry["path"], pattern)]
+
+    def find(self, path):
+        """
+        Return the entry of the section of a path, or raise ValueError if the bundle has no such section.
+
+        :param path: The path as shown in the section header.
+        """
+        entry = self.entries_by_path.get(path)
+        if entry is None:
+            raise ValueError(f"'{path}' is not in the bundle.")
+        return entry
+
+    def read(self, entry):
+        """
+        Return the content of a section, without its header, as bytes. For a "duplicate of" section written
+        by a deduplicated export, this is the content of the original section.
+
+        :param entry: The entry of the section, from list_files or find.
+        """
+        if entry.get("duplicate_of") is not None:
+            entry = self.entries[entry["duplicate_of"]]
+        data = self._map(entry["shard"])
+        return data[entry["content_offset"]:entry["offset"] + entry["length"]]
+
+    def grep(self, pattern, entries=None):
+        """
+        Search the content of sections for a regex, matching directly on the mapped bundle without copying it.
+
+        :param pattern: A compiled bytes regex. It is applied with re.MULTILINE, so that ^ and $ match at the
+                        start and end of every line, as in grep.
+        :param entries: The entries of the sections to search. Defaults to all sections.
+        :return: A generator of (entry, line number, line) tuples, line as bytes without its newline. As in
+                 read, a "duplicate of" section is searched in the content of its original, but reported
+                 with its own entry.
+        """
+        if not pattern.flags & re.MULTILINE:
+            pattern = re.compile(pattern.pattern, pattern.flags | re.MULTILINE)
+        for entry in self.entries if entries is None else entries:
+            section = entry
+            if entry.get("duplicate_of") is not None:
+                section = self.entries[entry["duplicate_of"]]
+            data = self._map(section["shard"])
+            start, end = section["content_offset"], section["offset"] + section["length"]
+            line_number, counted_to = 1, start
+            position = start
+            while position <= end:
+                match = pattern.search(data, position, end)
+                if match is None:
+                    break
+                line_start = data.rfind(b"\n", start, match.start()) + 1 or start
+                line_end = data.find(b"\n", match.start(), end)
+                line_end = end if line_end == -1 else line_end
+                line_number += data[counted_to:line_start].count(b"\n")
+                counted_to = line_start
+                yield entry, line_number, data[line_start:line_end]
+                # report every line once, however many matches it has
+                position = line_end + 1
+
+    def close(self):
+        """Closes the mapped bundle files."""
+        for data in self._maps.values():
+            # empty bundle files are not mapped
+            if data:
+                data.close()
+        self._maps = {}
+
+    def _map(self, shard):
+        """Returns the mapping of a bundle file, mapping it on first use."""
+        data = self._maps.get(shard)
+        if data is None:
+            data = self._maps[shard] = io_extender.map_file(self.shard_paths[shard])
+        return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List, extract or search files of an exported bundle through its index.")
+    parser.add_argument("bundle", help="The bundle (.log), its index (.index.json) or the output base of a sharded export.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="List the files of the bundle.")
+    list_parser.add_argument("--path", help="Only list paths matching this glob pattern.")
+
+    cat_parser = commands.add_parser("cat", help="Print the content of a file of the bundle.")
+    cat_parser.add_argument("path", help="The path as shown in the bundle.")
+
+    extract_parser = commands.add_parser("extract", help="Write files of the bundle back to a folder.")
+    extract_parser.add_argument("path", help="The path, or a glob pattern, as shown in the bundle.")
+    extract_parser.add_argument("--output-dir", default=".", help="Folder to write the files in (default: current folder).")
+
+    grep_parser = commands.add_parser("grep", help="Search the files of the bundle for a regular expression.")
+    grep_parser.add_argument("pattern", help="The regular expression.")
+    grep_parser.add_argument("--path", help="Only search paths matching this glob pattern.")
+    grep_parser.add_argument("-i", "--ignore-case", action="store_true", help="Ignore case.")
+
+    commands.add_parser("reindex", help="Rebuild the index of a single-file bundle by scanning it.")
+    args = parser.parse_args()
+
+    if args.command == "reindex":
+        count = reindex_bundle(args.bundle)
+        print(f"Indexed {count} files in: {bundle_index_path(args.bundle)}")
+        return
+
+    with BundleReader(resolve_index_path(args.bundle)) as reader:
+        if args.command == "list":
+            for entry in reader.list_files(args.path):
+                duplicate = entry.get("duplicate_of")
+                duplicate = f"\tduplicate of {reader.entries[duplicate]['path']}" if duplicate is not None else ""
+                print(f"{entry['path']}\tshard {entry['shard']}\toffset {entry['offset']}\tlength {entry['length']}{duplicate}")
+
+        elif args.command == "cat":
+            sys.stdout.buffer.write(reader.read(reader.find(args.path)))
+
+        elif args.command == "extract":
+            entries = reader.list_files(args.path) if has_glob_magic(args.path) else [reader.find(args.path)]
+            output_dir = os.path.abspath(args.output_dir)
+            for entry in entries:
+                target = os.path.abspath(os.path.join(output_dir, entry["path"]))
+                if os.path.commonpath([output_dir, target]) != output_dir:
+                    raise ValueError(f"Refusing to write '{entry['path']}' outside of '{output_dir}'.")
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, "wb") as f:
+                    f.write(reader.read(entry))
+                print(f"Extracted: {target}")
+
+        elif args.command == "grep":
+            flags = re.MULTILINE | (re.IGNORECASE if args.ignore_case else 0)
+            pattern = re.compile(args.pattern.encode(reader.encoding), flags)
+            entries = reader.list_files(args.path)
+            for entry, line_number, line in reader.grep(pattern, entries):
+                print(f"{entry['path']}:{line_number}:{line.decode(reader.encoding, errors='replace')}")
+
+def resolve_index_path(bundle):
+    """
+    Return the path of the index of a bundle, given the bundle file, the index itself or the output base of
+    a sharded export.
+
+    :param bundle: The path given by the user.
+    """
+    if bundle.endswith(".index.json"):
+        return bundle
+    return bundle_index_path(bundle)
+
+def reindex_bundle(bundle_path):
+    """
+    Scan a single-file bundle for its sections and write its index, replacing any existing one.
+
+    :param bundle_path: The path of the bundle file.
+    :return: The number of sections found.
+    """
+    if bundle_path.endswith(".index.json"):
+        raise ValueError("reindex needs the bundle file (.log), not its index.")
+    entries = scan_bundle(bundle_path)
+    write_bundle_index(bundle_index_path(bundle_path), [bundle_path], entries)
+    return len(entries)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,80 @@
 import os
+import re
+import sys
 import json
+import time
+import locale
+import hashlib
+import fnmatch
 import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Any
 
+from common import io_extender
+from common.instrumentation import RunStats, ThreadProfiles, add_instrumentation_arguments, profiled
+
+# Lines written before and after the path of every exported file
+FILE_SEPARATOR = "\n========================================================"
+PATH_SEPARATOR = "-------------------------"
+# Size of the output buffer, so headers and bodies reach the disk in large writes
+WRITE_BUFFER_SIZE = 1024 * 1024
+# With --workers, number of files read ahead per worker while waiting for the next file in order
+READ_AHEAD_PER_WORKER = 4
+# Size of the chunks used to hash files and to copy segments of a previous output
+COPY_CHUNK_SIZE = 1024 * 1024
+# Format version of the incremental export manifest, an unknown version triggers a full export
+MANIFEST_VERSION = 1
+# Number of leading bytes checked for a NUL byte to detect binary files, as git does
+BINARY_SNIFF_SIZE = 8192
+# Rough number of bytes per token of source code, used to estimate the size of shards in tokens
+APPROX_BYTES_PER_TOKEN = 4
+# With several projects, number of projects exported at once. Exports mostly wait on the disk, so threads overlap well
+DEFAULT_PROJECT_WORKERS = 4
+# Format version of the bundle index written next to every export, see write_bundle_index
+BUNDLE_INDEX_VERSION = 2
+# Matches the header of every section of a bundle, capturing the path, used to index bundles without an index
+SECTION_HEADER_PATTERN = re.compile(re.escape(f"{FILE_SEPARATOR}\n").encode() + rb"([^\n]*)\n"
+                                    + re.escape(f"{PATH_SEPARATOR}\n").encode())
+
 def load_project_config(config_path: str, project_name: str) -> dict:
+    return load_project_configs(config_path, [project_name])[project_name]
+
+def load_project_configs(config_path: str, project_names=None) -> dict:
+    """
+    Read the config file once and return the configs of several projects, with the defaults filled in.
+
+    :param config_path: The path of export_config.json.
+    :param project_names: The names of the projects, or None for every project of the file.
+    :return: A dict of project name -> config, in the order of project_names (or of the file).
+    """
     with open(config_path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
     projects = data.get("projects", {})
-    if project_name not in projects:
-        available = ", ".join(projects.keys())
-        raise ValueError(f"Unknown project '{project_name}'. Available: {available}")
-
-    cfg = projects[project_name]
+    if project_names is None:
+        project_names = list(projects)
+    for project_name in project_names:
+        if project_name not in projects:
+            available = ", ".join(projects.keys())
+            raise ValueError(f"Unknown project '{project_name}'. Available: {available}")
+    return {project_name: apply_config_defaults(projects[project_name]) for project_name in project_names}
 
+def apply_config_defaults(cfg: dict) -> dict:
+    """Fill in the defaults of the optional keys of a project config, in place, and return it."""
     # small defaults so config can be minimal
     cfg.setdefault("exclude_dirs_list", [])
     cfg.setdefault("exclude_files_list", [])
     cfg.setdefault("include_files_extensions", [])
     cfg.setdefault("output_file_name", "export_output")
     cfg.setdefault("output_file_path", "")
+    cfg.setdefault("respect_gitignore", False)
+    cfg.setdefault("skip_binary_files", False)
+    cfg.setdefault("max_file_size", None)
+    cfg.setdefault("shard_max_bytes", None)
+    cfg.setdefault("shard_max_lines", None)
+    cfg.setdefault("shard_max_tokens", None)
 
     return cfg
 
@@ -27,70 +82,1238 @@ def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", default="export_config.json")
-    parser.add_argument("--project", required=True)
+    project_group = parser.add_mutually_exclusive_group(required=True)
+    project_group.add_argument("--project", action="append",
+                               help="Project of the config to export. Repeat it to export several projects at once.")
+    project_group.add_argument("--all", action="store_true", help="Export every project of the config at once.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of threads reading files in parallel (default: 1, read sequentially).")
+    parser.add_argument("--project-workers", type=int, default=DEFAULT_PROJECT_WORKERS,
+                        help=f"With several projects, number of projects exported at once (default: {DEFAULT_PROJECT_WORKERS}).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Rebuild the output from the previous one, re-reading only the files that changed.")
+    parser.add_argument("--dedupe", action="store_true",
+                        help='Write the content of identical files once, later copies get a "duplicate of <path>" section.')
+    add_instrumentation_arguments(parser)
     args = parser.parse_args()
 
-    cfg = load_project_config(args.config, args.project)
+    if args.workers < 1 or args.project_workers < 1:
+        parser.error("--workers and --project-workers must be at least 1")
+    if args.dedupe and args.incremental:
+        parser.error("--dedupe cannot be used with --incremental")
+
+    cfgs = load_project_configs(args.config, None if args.all else list(dict.fromkeys(args.project)))
+    for project_name, cfg in cfgs.items():
+        if args.incremental and is_sharded(cfg):
+            parser.error(f"--incremental cannot be used with a sharded output (shard_max_* in the config of '{project_name}')")
+    try:
+        check_output_collisions(cfgs)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if len(cfgs) == 1:
+        stats = RunStats(quiet=args.quiet, timed=args.stats or args.quiet)
+        with profiled(args.profile, args.profile_output):
+            export_project(next(iter(cfgs.values())), workers=args.workers, incremental=args.incremental,
+                           dedupe=args.dedupe, stats=stats)
+        stats.finish()
+        if args.stats:
+            print(stats.report(), file=sys.stderr)
+        return
+
+    with profiled(args.profile, args.profile_output) as thread_profiles:
+        results = export_projects(cfgs, workers=args.workers, incremental=args.incremental, dedupe=args.dedupe,
+                                  project_workers=args.project_workers, quiet=args.quiet,
+                                  timed=args.stats or args.quiet, thread_profiles=thread_profiles)
+    if args.stats:
+        for result in results:
+            print(f"[{result['project']}]\n{result['stats'].report()}", file=sys.stderr)
+    print(format_project_summary(results))
+    if any(result["error"] for result in results):
+        sys.exit(1)
+
+def export_projects(cfgs, workers=1, incremental=False, dedupe=False, project_workers=DEFAULT_PROJECT_WORKERS,
+                    quiet=False, timed=False, thread_profiles=None):
+    """
+    Export several projects at once in a thread pool, as export_project does for each of them. Projects whose
+    fetch_path overlaps (the same folder, or one inside the other) share a DirectoryScanCache, so every folder
+    they have in common is listed once. A project that fails does not stop the others.
+
+    :param cfgs: A dict of project name -> config, as returned by load_project_configs. Their outputs must
+                 not collide, see check_output_collisions.
+    :param workers: The number of threads reading files, for each project.
+    :param incremental: Rebuild the outputs from the previous ones, see export_incremental.
+    :param dedupe: Replace the content of identical files with a reference, see ContentDeduplicator.
+    :param project_workers: The number of projects exported at once.
+    :param quiet: Replace the per-file messages with a progress line, see RunStats.
+    :param timed: Time the stages of every project.
+    :param thread_profiles: Optional ThreadProfiles, as yielded by profiled, the export of every project
+                            is run through, so that its thread is profiled too.
+    :return: A list with, for every project in the order of cfgs, a dict with its "project" name, "outputs"
+             (list of output files), "files" (number exported), "bytes" (size of the outputs), "seconds",
+             "stats" (its RunStats) and "error" (the exception message if it failed, else None).
+    """
+    scan_caches = group_overlapping_projects(cfgs)
+    thread_profiles = thread_profiles or ThreadProfiles()
+
+    def run(project_name):
+        cfg = cfgs[project_name]
+        stats = RunStats(quiet=quiet, timed=timed, label=project_name)
+        result = {"project": project_name, "outputs": [], "files": 0, "bytes": 0, "seconds": 0.0, "stats": stats,
+                  "error": None}
+        start = time.perf_counter()
+        try:
+            result["outputs"] = thread_profiles.run(export_project, cfg, workers=workers, incremental=incremental,
+                                                    dedupe=dedupe, stats=stats,
+                                                    scan_cache=scan_caches.get(project_name))
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["seconds"] = time.perf_counter() - start
+        stats.finish()
+        result["files"] = stats.processed
+        result["bytes"] = sum(os.path.getsize(path) for path in result["outputs"] if os.path.exists(path))
+        return result
+
+    with ThreadPoolExecutor(max_workers=project_workers) as executor:
+        return list(executor.map(run, cfgs))
+
+def group_overlapping_projects(cfgs):
+    """
+    Find the projects whose fetch_path overlaps another one's (the same folder, or one inside the other) and
+    give every group of overlapping projects a shared DirectoryScanCache.
+
+    :param cfgs: A dict of project name -> config.
+    :return: A dict of project name -> DirectoryScanCache, only for the projects that overlap another one.
+    """
+    roots = {name: os.path.abspath(cfg["fetch_path"]) for name, cfg in cfgs.items()}
+    groups = []   # lists of project names
+    for name, root in roots.items():
+        overlapping = [group for group in groups
+                       if any(os.path.commonpath([root, roots[other]]) in (root, roots[other]) for other in group)]
+        merged = [name]
+        for group in overlapping:
+            groups.remove(group)
+            merged.extend(group)
+        groups.append(merged)
+
+    scan_caches = {}
+    for group in groups:
+        if len(group) > 1:
+            scan_cache = DirectoryScanCache()
+            for name in group:
+                scan_caches[name] = scan_cache
+    return scan_caches
+
+def get_output_base(cfg):
+    """Return the path of the output of a project without extension: `<output_file_name>_<version>_file`."""
+    output_base = f"{cfg['output_file_name']}_{cfg['version']}_file"
+    return os.path.join(cfg["output_file_path"], output_base) if cfg["output_file_path"] else output_base
+
+def check_output_collisions(cfgs):
+    """
+    Raise ValueError if two projects would write the same output, which exporting them at once would corrupt.
+
+    :param cfgs: A dict of project name -> config.
+    """
+    owners = {}
+    for name, cfg in cfgs.items():
+        output_base = os.path.abspath(get_output_base(cfg))
+        if output_base in owners:
+            raise ValueError(f"Projects '{owners[output_base]}' and '{name}' write the same output: {output_base}")
+        owners[output_base] = name
+
+def format_project_summary(results):
+    """
+    Format the results of export_projects as a table: files, MB written, seconds and files/s of every project.
+
+    :param results: The list returned by export_projects.
+    :return: The table as a multi-line string.
+    """
+    lines = [f"{'project':<24} {'files':>8} {'MB':>9} {'seconds':>9} {'files/s':>9}  status"]
+    for result in results:
+        seconds = result["seconds"]
+        rate = f"{result['files'] / seconds:.0f}" if seconds else "-"
+        status = f"failed: {result['error']}" if result["error"] else "ok"
+        lines.append(f"{result['project']:<24} {result['files']:>8} {result['bytes'] / (1024 * 1024):>9.2f} "
+                     f"{seconds:>9.3f} {rate:>9}  {status}")
+    return "\n".join(lines)
+
+def is_sharded(cfg):
+    """Return True if a project config asks for a sharded output (any shard_max_* budget set)."""
+    return any(cfg.get(key) for key in ("shard_max_bytes", "shard_max_lines", "shard_max_tokens"))
+
+def export_project(cfg, workers=1, incremental=False, dedupe=False, stats=None, scan_cache=None):
+    """
+    Export the files of one project, as configured in export_config.json, into its output.
+
+    :param cfg: The project config, as returned by load_project_config.
+    :param workers: The number of threads reading files.
+    :param incremental: Rebuild the output from the previous one, see export_incremental.
+    :param dedupe: Replace the content of identical files with a reference, see ContentDeduplicator.
+    :param stats: Optional RunStats timing the walk, read, transform and write stages and reporting progress.
+    :param scan_cache: Optional DirectoryScanCache shared with other projects walking the same folders.
+    :return: The list of output files written.
+    """
+    if incremental and (dedupe or is_sharded(cfg)):
+        raise ValueError("An incremental export cannot be deduplicated or sharded.")
+    stats = stats if stats is not None else RunStats(timed=False)
 
     fetch_path = cfg["fetch_path"]
     root_dir_name = cfg["root_dir_name"]
     exclude_dirs_list = cfg["exclude_dirs_list"]
     exclude_files_list = cfg["exclude_files_list"]
     include_files_extensions = cfg["include_files_extensions"]
-    output_file_name = cfg["output_file_name"]
-    output_file_path = cfg["output_file_path"]
-    output_version = cfg["version"]
-
-    # read files from folder
-    files = list_files_with_extensions(fetch_path, exclude_dirs_list, exclude_files_list, include_files_extensions )
-    # [print(file) for file in files]
-    # exit()
-    chunk_files = split_list_into_chunks(files, 7)
-    for ind, files in enumerate(chunk_files):
-        # current_output_file = output_file_name + f"_{ind}.log"
-        current_output_file = f"{output_file_name}_{output_version}_file.log"
-        for file in files:
-            folder = get_folder_path_from_root(file, root_dir_name)
-            file_name = os.path.basename(file)
-            print(f"Processing: {os.path.join(folder, file_name)}")
-            lines = read_file_to_lines(file)
-            # lines = remove_empty_lines(lines)
-            write_to_file_from_str("\n========================================================", current_output_file, output_file_path)
-            write_to_file_from_str(os.path.join(folder, file_name), current_output_file, output_file_path)
-            write_to_file_from_str("-------------------------", current_output_file, output_file_path)
-            write_to_file_from_list(lines, current_output_file, output_file_path)
-
-    print("Please check output file")
+    output_base = get_output_base(cfg)
 
-def list_files_with_extensions(folder_path, exclude_dirs_list=[], exclude_files_list=[], include_files_extensions=[]):
+    # walk the folder lazily, so export starts before the walk finishes
+    files = iter_files_with_extensions(fetch_path, exclude_dirs_list, exclude_files_list, include_files_extensions,
+                                       respect_gitignore=cfg["respect_gitignore"],
+                                       skip_binary_files=cfg["skip_binary_files"],
+                                       max_file_size=cfg["max_file_size"], scan_cache=scan_cache)
+    files = stats.timed_iter("walk", files)
+    if is_sharded(cfg):
+        shard_paths = export_sharded(files, root_dir_name, output_base, cfg["shard_max_bytes"], cfg["shard_max_lines"],
+                                     cfg["shard_max_tokens"], workers=workers, dedupe=dedupe, stats=stats)
+        stats.log(f"Please check the {len(shard_paths)} output files, listed in: {output_base}.index.json")
+        return shard_paths
+
+    if incremental:
+        output_path = output_base + ".log"
+        export_incremental(files, root_dir_name, output_path, workers, stats=stats)
+        stats.log(f"Please check output file: {output_path}")
+        return [output_path]
+
+    # keep one buffered handle open for the whole export instead of reopening the output for every write
+    with ExportWriter(output_base + ".log", dedupe=dedupe, stats=stats) as writer:
+        if workers == 1:
+            for file in files:
+                display_path = get_display_path(file, root_dir_name)
+                stats.progress(f"Processing: {display_path}")
+                writer.write_header(display_path, file)
+                writer.copy_file(file)
+        else:
+            # files are read ahead by a thread pool, and still written in the order they were listed
+            for file, content in stats.timed_iter("read", read_files_ordered(files, workers), content_length):
+                display_path = get_display_path(file, root_dir_name)
+                stats.progress(f"Processing: {display_path}")
+                writer.write_header(display_path, file)
+                writer.write_content(content)
+
+    stats.log(f"Please check output file: {writer.save_path}")
+    return [writer.save_path]
+
+class ExportWriter:
     """
-    Lists files from a directory and its subdirectories, including only the specified file extensions.
-    
+    Writes the export output through a single buffered handle that stays open for the whole run.
+    Produces the same output as calling write_to_file_from_str for the header lines and
+    write_to_file_from_list for the body of every file, without opening the output file four times per file.
+
+    Text is encoded by the writer itself, so it knows the byte offset of every section without flushing.
+    On close, the index of the bundle (`<output>.index.json`, see write_bundle_index) is written next to it,
+    extending the index of the sections already in the file when appending.
+
+    With dedupe, the content of a file identical to one already written in this run is replaced by a
+    "duplicate of <path>" reference (see ContentDeduplicator), and its index entry gets a "duplicate_of" key
+    with the number of the original section. write_content must then be called once per section.
+
+    With stats, reading the copied files is timed as the read stage, encoding and writing as the write stage,
+    and looking for duplicates as the transform stage.
+    """
+
+    def __init__(self, file_name, file_path=None, buffer_size=WRITE_BUFFER_SIZE, dedupe=False, stats=None):
+        """
+        :param file_name: The name of the output file. Content is appended if it already exists.
+        :param file_path: Optional folder of the output file. Defaults to the current directory.
+        :param buffer_size: Size in bytes of the write buffer.
+        :param dedupe: Replace the content of files identical to an already written one with a reference.
+        :param stats: Optional RunStats the read, transform and write stages are timed in.
+        """
+        self.stats = stats if stats is not None else RunStats(timed=False)
+        self.save_path = os.path.join(file_path, file_name) if file_path else file_name
+        self.index_path = bundle_index_path(self.save_path)
+        self.encoding = locale.getpreferredencoding(False)
+        self.file_obj = io_extender.open_buffered_writer(self.save_path, "ab", buffer_size=buffer_size)
+        self.position = self.file_obj.tell()
+        # sections already in the file, from its index or, if it has none, from a scan of the file
+        self.index_entries = load_bundle_entries(self.index_path, self.save_path) if self.position else []
+        self.deduplicator = ContentDeduplicator() if dedupe else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_header(self, display_path, source_path=None):
+        """
+        Writes the separator block that precedes the content of every exported file.
+
+        :param display_path: The path of the file as shown in the output.
+        :param source_path: The path of the source file, recorded in the index.
+        """
+        self._end_section()
+        offset = self.position
+        self._write_text(f"{FILE_SEPARATOR}\n{display_path}\n{PATH_SEPARATOR}\n")
+        self.index_entries.append({"path": display_path, "source": source_path, "shard": 0, "offset": offset,
+                                   "length": None, "content_offset": self.position})
+
+    def write_lines(self, lines):
+        """
+        Writes already read lines, as write_to_file_from_list does.
+
+        :param lines: List of strings to be written.
+        """
+        self._write_text("".join(lines))
+
+    def write_content(self, content):
+        """
+        Writes the already read content of a file.
+
+        :param content: The content as returned by read_file_content.
+        """
+        if self.deduplicator is not None and self.index_entries:
+            with self.stats.stage("transform"):
+                digest = content_digest(content)
+            if self._write_duplicate_reference(digest, len(content)):
+                return
+        self._write_text(content)
+
+    def copy_file(self, source_path):
+        """
+        Copies the content of a file to the output in chunks, without materializing it as a list of lines.
+        The file is decoded like read_file_to_lines does (undecodable bytes are dropped), so the output is
+        the same as writing the lines it returns.
+
+        With dedupe, a first pass hashes the file chunk by chunk, and the file is only copied, in a second
+        pass, if it is not a duplicate. A file read in a single chunk is written from that chunk.
+
+        :param source_path: The file to copy.
+        :return: True if the file was copied, False if it could not be read.
+        """
+        try:
+            # the writes nested in the read stage are timed as their own stages
+            with self.stats.stage("read", items=1), open(source_path, "r", errors='ignore') as source:
+                if self.deduplicator is not None and self.index_entries:
+                    digest, length, content = self._hash_source(source)
+                    if self._write_duplicate_reference(digest, length):
+                        return True
+                    if content is not None:
+                        self._write_text(content)
+                        return True
+                    source.seek(0)
+                for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), ""):
+                    self.stats.add("read", nbytes=len(chunk))
+                    self._write_text(chunk)
+            return True
+        except FileNotFoundError:
+            print(f"Error: File '{os.path.basename(source_path)}' not found at '{source_path}'")
+            return False
+        except IOError as e:
+            print(f"Error reading file '{os.path.basename(source_path)}': {e}")
+            return False
+
+    def _hash_source(self, source):
+        """
+        Hash the decoded content of an open file in chunks, as ContentDeduplicator does with a whole content.
+
+        :param source: The file, open in text mode at its start.
+        :return: The (digest, length in characters, content) of the file, content only if it was read in a
+                 single chunk, else None.
+        """
+        digest = hashlib.sha256()
+        length = 0
+        content = None
+        for chunk_number, chunk in enumerate(iter(lambda: source.read(COPY_CHUNK_SIZE), "")):
+            self.stats.add("read", nbytes=len(chunk))
+            with self.stats.stage("transform"):
+                digest.update(chunk.encode("utf-8", "surrogatepass"))
+            length += len(chunk)
+            content = chunk if chunk_number == 0 else None
+        return digest.digest(), length, "" if length == 0 else content
+
+    def _write_duplicate_reference(self, digest, length):
+        """
+        Write a "duplicate of <path>" reference as the content of the current section if a section with the
+        same content was already written, see ContentDeduplicator.
+
+        :param digest: The digest of the content, see content_digest.
+        :param length: The length of the content in characters.
+        :return: True if the reference was written, False if the content must be written.
+        """
+        entry = self.index_entries[-1]
+        with self.stats.stage("transform"):
+            original = self.deduplicator.find_original_digest(digest, length, len(self.index_entries) - 1,
+                                                              entry["path"])
+        if original is None:
+            return False
+        entry["duplicate_of"], original_path = original
+        self._write_text(duplicate_reference(original_path))
+        return True
+
+    def close(self):
+        """Flushes the buffer, closes the output file and writes its index."""
+        if not self.file_obj.closed:
+            self._end_section()
+            self.file_obj.close()
+            write_bundle_index(self.index_path, [self.save_path], self.index_entries)
+
+    def _write_text(self, text):
+        """Encodes text as a text mode file would and writes it, both timed as the write stage."""
+        with self.stats.stage("write") as timer:
+            if os.linesep != "\n":
+                text = text.replace("\n", os.linesep)
+            data = text.encode(self.encoding)
+            timer.nbytes = len(data)
+            self.file_obj.write(data)
+        self.position += len(data)
+
+    def _end_section(self):
+        """Records the length of the section being written, if any."""
+        if self.index_entries and self.index_entries[-1]["length"] is None:
+            self.index_entries[-1]["length"] = self.position - self.index_entries[-1]["offset"]
+
+class ContentDeduplicator:
+    """
+    Remembers the SHA-256 of the content of every section written in an export, to replace the content of later
+    identical files with a short "duplicate of <path>" reference. Contents not longer than their reference
+    (e.g. empty files) are always written as they are.
+    """
+
+    def __init__(self):
+        self.originals = {}   # content digest -> (section number, path) of its first copy
+
+    def find_original(self, content, section, display_path):
+        """
+        Return the (section number, path) of the first section with the same content, or None if the content
+        was not written yet, in which case it is recorded as the original of later copies.
+
+        :param content: The content of the file.
+        :param section: The number of the section the content would be written in.
+        :param display_path: The path of the file as shown in its header.
+        """
+        if len(content) <= len(duplicate_reference(display_path)):
+            return None
+        return self.find_original_digest(content_digest(content), len(content), section, display_path)
+
+    def find_original_digest(self, digest, length, section, display_path):
+        """
+        Like find_original, given the digest and length of the content rather than the content itself, so that
+        a file can be hashed chunk by chunk.
+
+        :param digest: The digest of the content, see content_digest.
+        :param length: The length of the content in characters.
+        :param section: The number of the section the content would be written in.
+        :param display_path: The path of the file as shown in its header.
+        """
+        if length <= len(duplicate_reference(display_path)):
+            return None
+        original = self.originals.get(digest)
+        if original is None:
+            self.originals[digest] = (section, display_path)
+        return original
+
+def content_digest(content):
+    """
+    Return the SHA-256 digest ContentDeduplicator identifies a content by.
+
+    :param content: The content of a file, as a str.
+    """
+    return hashlib.sha256(content.encode("utf-8", "surrogatepass")).digest()
+
+def duplicate_reference(original_path):
+    """
+    Return the content written in place of a file identical to an already exported one.
+
+    :param original_path: The path of the first copy as shown in its header.
+    """
+    return f"duplicate of {original_path}\n"
+
+class ShardedWriter:
+    """
+    Writes the export as numbered shards, rolling over to a new shard before a file would take the current one
+    past any of the budgets: bytes, lines, or approximate tokens (APPROX_BYTES_PER_TOKEN bytes per token).
+    Files are never split, so a file larger than the budget gets a shard of its own.
+
+    Each full shard is written by a background thread while the next one is filled, with at most `workers`
+    shards waiting to be written. On close, the index of the bundle (`<output_base>.index.json`, see
+    write_bundle_index) records for every exported file its shard and the byte offset and length of its segment.
+    """
+
+    def __init__(self, output_base, max_bytes=None, max_lines=None, max_tokens=None, workers=1):
+        """
+        :param output_base: The output path without extension. Shards are `<output_base>_<n>.log`.
+        :param max_bytes: Maximum size of a shard in bytes, or None.
+        :param max_lines: Maximum number of lines of a shard, or None.
+        :param max_tokens: Maximum approximate number of tokens of a shard, or None.
+        :param workers: Number of threads writing shards, and of full shards kept in memory waiting to be written.
+        """
+        if not (max_bytes or max_lines or max_tokens):
+            raise ValueError("At least one of max_bytes, max_lines and max_tokens must be set.")
+        self.output_base = output_base
+        self.index_path = output_base + ".index.json"
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.max_tokens = max_tokens
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending_writes = deque()
+        self.shard_paths = []
+        self.index_entries = []
+        self._start_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(wait=True)
+
+    def shard_path(self, shard_number):
+        """Return the path of a shard."""
+        return f"{self.output_base}_{shard_number}.log"
+
+    def write_segment(self, display_path, source_path, segment, header_length, duplicate_of=None):
+        """
+        Add the segment of one file to the current shard, rolling over to a new shard first if it would not fit.
+
+        :param display_path: The path of the file as shown in its header.
+        :param source_path: The path of the source file.
+        :param segment: The encoded header and content of the file, as built by build_segment.
+        :param header_length: The length in bytes of the header at the start of the segment.
+        :param duplicate_of: The section number of the original, if the segment holds a duplicate reference.
+        """
+        lines = segment.count(b"\n")
+        if self.segments and self._exceeds_budget(len(segment), lines):
+            self._flush_shard()
+            self._start_shard()
+
+        self.index_entries.append({"path": display_path, "source": source_path, "shard": len(self.shard_paths),
+                                   "offset": self.shard_bytes, "length": len(segment),
+                                   "content_offset": self.shard_bytes + header_length})
+        if duplicate_of is not None:
+            self.index_entries[-1]["duplicate_of"] = duplicate_of
+        self.segments.append(segment)
+        self.shard_bytes += len(segment)
+        self.shard_lines += lines
+
+    def close(self):
+        """
+        Write the last shard, wait for all shard writes, write the index and remove the shards left over
+        from a previous export with more shards.
+
+        :return: The list of shard paths.
+        """
+        if self.segments or not self.shard_paths:
+            self._flush_shard()
+        while self.pending_writes:
+            self.pending_writes.popleft().result()
+        self.executor.shutdown(wait=True)
+
+        write_bundle_index(self.index_path, self.shard_paths, self.index_entries)
+
+        stale_shard = len(self.shard_paths)
+        while os.path.exists(self.shard_path(stale_shard)):
+            os.remove(self.shard_path(stale_shard))
+            stale_shard += 1
+        return self.shard_paths
+
+    def _exceeds_budget(self, segment_bytes, segment_lines):
+        """Return True if adding a segment to the current shard would exceed one of the budgets."""
+        new_bytes = self.shard_bytes + segment_bytes
+        return ((self.max_bytes and new_bytes > self.max_bytes)
+                or (self.max_lines and self.shard_lines + segment_lines > self.max_lines)
+                or (self.max_tokens and estimate_tokens(new_bytes) > self.max_tokens))
+
+    def _start_shard(self):
+        """Start filling a new, empty shard."""
+        self.segments = []
+        self.shard_bytes = 0
+        self.shard_lines = 0
+
+    def _flush_shard(self):
+        """Hand the current shard to a writing thread, first waiting for the oldest write if too many are queued."""
+        while len(self.pending_writes) >= self.workers:
+            self.pending_writes.popleft().result()
+        path = self.shard_path(len(self.shard_paths))
+        self.shard_paths.append(path)
+        self.pending_writes.append(self.executor.submit(write_shard, path, self.segments))
+
+def bundle_index_path(output_path):
+    """
+    Return the path of the index of an export: the output path with its ".log" extension, if any, replaced by
+    ".index.json". Only ".log" is removed, as the output base of a sharded export has no extension but may
+    hold dots, e.g. from a version "v1.2".
+
+    :param output_path: The path of the output file, or of the output base of a sharded export.
+    """
+    if output_path.endswith(".log"):
+        output_path = output_path[:-len(".log")]
+    return output_path + ".index.json"
+
+def write_bundle_index(index_path, shard_paths, entries):
+    """
+    Atomically write the index of an exported bundle. The index is a JSON object with:
+    - "shards": the file names of the bundle files (shards), relative to the directory of the index;
+    - "shard_sizes": their sizes, so that readers can detect an index that no longer matches;
+    - "files": one entry per section, with the "path" shown in its header, the "source" path it was read
+      from, its "shard" number, and the "offset", "length" and "content_offset" (start of the content after
+      the header) of the section in bytes.
+
+    :param index_path: The path of the index file.
+    :param shard_paths: The paths of the files of the bundle, in order.
+    :param entries: The section entries.
+    """
+    data = {"version": BUNDLE_INDEX_VERSION, "shards": [os.path.basename(path) for path in shard_paths],
+            "shard_sizes": [os.path.getsize(path) for path in shard_paths], "files": entries}
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, index_path)
+
+def load_bundle_entries(index_path, bundle_path):
+    """
+    Return the section entries of a single-file bundle from its index, or by scanning the bundle if the index
+    is missing or does not match the bundle.
+
+    :param index_path: The path of the index file.
+    :param bundle_path: The path of the bundle file.
+    :return: The list of section entries.
+    """
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if (data.get("version") == BUNDLE_INDEX_VERSION and len(data["shards"]) == 1
+                and data["shard_sizes"] == [os.path.getsize(bundle_path)]):
+            return data["files"]
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    return scan_bundle(bundle_path)
+
+def scan_bundle(bundle_path, shard=0):
+    """
+    Build the section entries of a bundle without an index by finding every section header in it.
+    This is a linear scan over the file (through mmap), and a file whose content contains a line of "="
+    followed by a path and a line of "-" exactly like a header is split there.
+
+    :param bundle_path: The path of the bundle file.
+    :param shard: The shard number to record in the entries.
+    :return: The list of section entries, without source paths.
+    """
+    size = os.path.getsize(bundle_path)
+    if size == 0:
+        return []
+    entries = []
+    with io_extender.open_mmap(bundle_path) as data:
+        for match in SECTION_HEADER_PATTERN.finditer(data):
+            if entries:
+                entries[-1]["length"] = match.start() - entries[-1]["offset"]
+            entries.append({"path": match.group(1).decode(locale.getpreferredencoding(False), errors="replace"),
+                            "source": None, "shard": shard, "offset": match.start(), "length": None,
+                            "content_offset": match.end()})
+    if entries:
+        entries[-1]["length"] = size - entries[-1]["offset"]
+    return entries
+
+def write_shard(shard_path, segments):
+    """
+    Write the segments of one shard to its file, replacing it if it exists.
+
+    :param shard_path: The path of the shard.
+    :param segments: The list of encoded segments.
+    """
+    with io_extender.open_buffered_writer(shard_path, "wb", buffer_size=WRITE_BUFFER_SIZE) as f:
+        f.writelines(segments)
+
+def estimate_tokens(byte_count):
+    """
+    Estimate the number of tokens of a text from its size, at APPROX_BYTES_PER_TOKEN bytes per token.
+
+    :param byte_count: The size of the text in bytes.
+    :return: The approximate number of tokens.
+    """
+    return -(-byte_count // APPROX_BYTES_PER_TOKEN)
+
+def export_sharded(files, root_dir_name, output_base, max_bytes=None, max_lines=None, max_tokens=None, workers=1,
+                   dedupe=False, stats=None):
+    """
+    Export files into shards limited by size, lines or approximate tokens, with an index file. See ShardedWriter.
+
+    :param files: The file paths to export, e.g. as returned by list_files_with_extensions.
+    :param root_dir_name: The directory from which the paths shown in the output start.
+    :param output_base: The output path without extension. Shards are `<output_base>_<n>.log` and the index
+                        `<output_base>.index.json`.
+    :param max_bytes: Maximum size of a shard in bytes, or None.
+    :param max_lines: Maximum number of lines of a shard, or None.
+    :param max_tokens: Maximum approximate number of tokens of a shard, or None.
+    :param workers: The number of threads reading files, and writing shards.
+    :param dedupe: Replace the content of files identical to an already written one with a reference.
+    :param stats: Optional RunStats timing the read, transform and write stages and reporting progress.
+    :return: The list of shard paths.
+    """
+    stats = stats if stats is not None else RunStats(timed=False)
+    encoding = locale.getpreferredencoding(False)
+    if workers > 1:
+        contents = read_files_ordered(files, workers)
+    else:
+        contents = ((file, read_file_content(file)) for file in files)
+
+    deduplicator = ContentDeduplicator() if dedupe else None
+    with ShardedWriter(output_base, max_bytes, max_lines, max_tokens, workers) as writer:
+        for file, content in stats.timed_iter("read", contents, content_length):
+            display_path = get_display_path(file, root_dir_name)
+            stats.progress(f"Processing: {display_path}")
+            with stats.stage("transform"):
+                original = None
+                if deduplicator is not None:
+                    original = deduplicator.find_original(content, len(writer.index_entries), display_path)
+                    if original is not None:
+                        content = duplicate_reference(original[1])
+                header_length = len(build_segment(display_path, "", encoding))
+                segment = build_segment(display_path, content, encoding)
+            # shards are written by background threads, this is the time spent waiting for them
+            with stats.stage("write", nbytes=len(segment)):
+                writer.write_segment(display_path, file, segment, header_length, original[0] if original else None)
+    return writer.shard_paths
+
+class ExportManifest:
+    """
+    Records, for every file of an export, its mtime, size and content hash, and where its segment (the header
+    and the content) lies in the output file. An incremental export copies the segments of unchanged files
+    from the previous output instead of reading them again. The manifest is stored as JSON next to the output.
+    """
+
+    def __init__(self, manifest_path, entries=None):
+        """
+        :param manifest_path: The path of the manifest file.
+        :param entries: The entries of the manifest, by source file path.
+        """
+        self.manifest_path = manifest_path
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, manifest_path, output_path):
+        """
+        Load the manifest of a previous export. An empty manifest is returned if there is none, or if the
+        output file no longer matches it, so that everything is exported again.
+
+        :param manifest_path: The path of the manifest file.
+        :param output_path: The path of the output file the manifest describes.
+        :return: An ExportManifest.
+        """
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return cls(manifest_path)
+
+        if (data.get("version") != MANIFEST_VERSION or not os.path.exists(output_path)
+                or os.path.getsize(output_path) != data.get("output_size")):
+            return cls(manifest_path)
+        return cls(manifest_path, data.get("files", {}))
+
+    def find_segment(self, file_path, display_path, stat_result):
+        """
+        Return the entry of a file if it is unchanged since the previous export, or None. A file is unchanged
+        if its mtime and size match, or, when only its mtime changed, if its content hash matches.
+
+        :param file_path: The path of the source file.
+        :param display_path: The path of the file as shown in the output header.
+        :param stat_result: The os.stat result of the source file.
+        :return: The manifest entry, or None if the file must be exported again.
+        """
+        entry = self.entries.get(file_path)
+        if entry is None or entry["display_path"] != display_path or entry["size"] != stat_result.st_size:
+            return None
+        if entry["mtime_ns"] == stat_result.st_mtime_ns:
+            return entry
+        if entry["sha256"] == file_sha256(file_path):
+            return entry
+        return None
+
+    def save(self, entries, output_size):
+        """
+        Atomically replace the manifest with the entries of a new export.
+
+        :param entries: The entries of the new export, by source file path.
+        :param output_size: The size in bytes of the new output file.
+        """
+        self.entries = entries
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "output_size": output_size, "files": entries}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+def export_incremental(files, root_dir_name, output_path, workers=1, stats=None):
+    """
+    Export files to output_path, reusing the segments of unchanged files from the previous output.
+
+    Unlike the default export, which appends to the output file, the output is rebuilt to contain exactly the
+    current files, in a temporary file that replaces it at the end. Segments of unchanged files are copied as
+    bytes from the previous output; changed and new files are read again (with `workers` threads).
+    The manifest is written to output_path + ".manifest.json".
+
+    :param files: The list of file paths to export, e.g. as returned by list_files_with_extensions.
+    :param root_dir_name: The directory from which the paths shown in the output start.
+    :param output_path: The path of the output file.
+    :param workers: The number of threads reading changed files.
+    :param stats: Optional RunStats timing the read, transform and write stages and reporting progress.
+                  Checking whether files changed (stat and hash) is timed as the "check" stage.
+    :return: A (reused, exported) tuple with the number of files copied from the previous output and read again.
+    """
+    stats = stats if stats is not None else RunStats(timed=False)
+    manifest = ExportManifest.load(output_path + ".manifest.json", output_path)
+    encoding = locale.getpreferredencoding(False)
+
+    # decide first which files must be read, so that they can be read ahead in parallel
+    plan = []
+    for file in files:
+        with stats.stage("check", items=1):
+            display_path = get_display_path(file, root_dir_name)
+            try:
+                stat_result = os.stat(file)
+            except OSError:
+                stat_result = None
+            entry = manifest.find_segment(file, display_path, stat_result) if stat_result else None
+            # hash before reading, so a file modified meanwhile is seen as changed by the next export
+            digest = None if entry or not stat_result else file_sha256(file)
+        plan.append((file, display_path, stat_result, entry, digest))
+
+    changed_files = [file for file, _, _, entry, _ in plan if entry is None]
+    if workers > 1:
+        contents = read_files_ordered(changed_files, workers)
+    else:
+        contents = ((file, read_file_content(file)) for file in changed_files)
+    contents = stats.timed_iter("read", contents, content_length)
+
+    # the old manifest no longer describes the output once it is replaced, remove it first
+    if os.path.exists(manifest.manifest_path):
+        os.remove(manifest.manifest_path)
+
+    entries = {}
+    index_entries = []
+    offset = reused = 0
+    tmp_path = output_path + ".tmp"
+    previous = open(output_path, "rb") if manifest.entries else None
+    try:
+        with io_extender.open_buffered_writer(tmp_path, "wb", buffer_size=WRITE_BUFFER_SIZE) as output:
+            for file, display_path, stat_result, entry, digest in plan:
+                if entry is not None:
+                    with stats.stage("write", nbytes=entry["length"]):
+                        length = copy_segment(previous, output, entry["offset"], entry["length"])
+                    digest = entry["sha256"]
+                    reused += 1
+                    stats.progress()
+                else:
+                    _, content = next(contents)
+                    stats.progress(f"Processing: {display_path}")
+                    with stats.stage("transform"):
+                        segment = build_segment(display_path, content, encoding)
+                    with stats.stage("write", nbytes=len(segment)):
+                        output.write(segment)
+                    length = len(segment)
+                header_length = len(build_segment(display_path, "", encoding))
+                index_entries.append({"path": display_path, "source": file, "shard": 0, "offset": offset,
+                                      "length": length, "content_offset": offset + header_length})
+                if stat_result is not None:
+                    entries[file] = {"display_path": display_path, "mtime_ns": stat_result.st_mtime_ns,
+                                     "size": stat_result.st_size, "sha256": digest,
+                                     "offset": offset, "length": length}
+                offset += length
+    finally:
+        if previous:
+            previous.close()
+
+    os.replace(tmp_path, output_path)
+    manifest.save(entries, offset)
+    write_bundle_index(bundle_index_path(output_path), [output_path], index_entries)
+    stats.log(f"Reused {reused} unchanged files, exported {len(plan) - reused} changed or new files")
+    return reused, len(plan) - reused
+
+def build_segment(display_path, content, encoding):
+    """
+    Build the bytes that ExportWriter writes for one file: the header followed by the content.
+
+    :param display_path: The path of the file as shown in the header.
+    :param content: The content of the file, as returned by read_file_content.
+    :param encoding: The encoding of the output file.
+    :return: The encoded segment.
+    """
+    text = f"{FILE_SEPARATOR}\n{display_path}\n{PATH_SEPARATOR}\n{content}"
+    if os.linesep != "\n":
+        text = text.replace("\n", os.linesep)
+    return text.encode(encoding)
+
+def copy_segment(source, destination, offset, length):
+    """
+    Copy length bytes at offset of the binary file source to the binary file destination.
+
+    :param source: The binary file object to copy from.
+    :param destination: The binary file object to copy to.
+    :param offset: The position of the segment in source.
+    :param length: The length of the segment in bytes.
+    :return: The number of bytes copied.
+    """
+    source.seek(offset)
+    remaining = length
+    while remaining > 0:
+        chunk = source.read(min(remaining, COPY_CHUNK_SIZE))
+        if not chunk:
+            raise ValueError(f"Segment at {offset} of {length} bytes is past the end of the previous output.")
+        destination.write(chunk)
+        remaining -= len(chunk)
+    return length
+
+def file_sha256(file_path):
+    """
+    Compute the SHA-256 of the content of a file, reading it in chunks.
+
+    :param file_path: The path of the file.
+    :return: The hex digest.
+    """
+    digest = hashlib.sha256()
+    for chunk in io_extender.iter_chunks(file_path, COPY_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+class NameFilter:
+    """
+    File and directory name filters compiled once per walk: exact names are looked up in a set, glob
+    patterns (names containing *, ? or [, e.g. "*.min.js" or "build-*") are combined into a single regex,
+    and extensions are checked with one str.endswith(tuple) call.
+    """
+
+    def __init__(self, names=(), extensions=()):
+        """
+        :param names: Exact names or glob patterns to match.
+        :param extensions: File extensions to match (e.g., ['.ts', '.tsx']).
+        """
+        names = list(names or [])
+        self.names = frozenset(name for name in names if not has_glob_magic(name))
+        patterns = [fnmatch.translate(name) for name in names if has_glob_magic(name)]
+        self.pattern = re.compile("|".join(patterns)) if patterns else None
+        self.extensions = tuple(extensions or ())
+
+    def matches_name(self, name):
+        """Return True if name is one of the names or matches one of the glob patterns."""
+        return name in self.names or (self.pattern is not None and self.pattern.match(name) is not None)
+
+    def matches_extension(self, name):
+        """Return True if name ends with one of the extensions."""
+        return bool(self.extensions) and name.endswith(self.extensions)
+
+def has_glob_magic(name):
+    """Return True if name contains glob wildcards (*, ? or [)."""
+    return any(char in name for char in "*?[")
+
+class GitIgnore:
+    """
+    The rules of one .gitignore file, compiled once. Consecutive rules of the same kind (ignore, or "!"
+    re-include) are combined into a single regex, and the groups are checked from last to first, so the last
+    matching rule decides as in git, usually with one regex match per path.
+    """
+
+    def __init__(self, lines, base=""):
+        """
+        :param lines: The lines of the .gitignore file.
+        :param base: The path of the directory holding the .gitignore, relative to the walk root ("" for the root).
+        """
+        self.base = base
+        rules = [rule for rule in (parse_gitignore_line(line) for line in lines) if rule]
+        # directories are matched by every rule, files only by the rules without a trailing "/"
+        self.dir_groups = compile_gitignore_groups(rules)
+        self.file_groups = compile_gitignore_groups([rule for rule in rules if not rule[2]])
+
+    @classmethod
+    def from_file(cls, file_path, base=""):
+        """
+        Read and compile a .gitignore file.
+
+        :param file_path: The path of the .gitignore file.
+        :param base: The path of its directory, relative to the walk root.
+        :return: A GitIgnore.
+        """
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+            return cls(f.read().splitlines(), base)
+
+    def match(self, rel_path, is_dir):
+        """
+        Return True if the path is ignored, False if it is re-included by a "!" rule, or None if no rule matches.
+
+        :param rel_path: The path relative to the walk root, with "/" separators.
+        :param is_dir: Whether the path is a directory.
+        """
+        if self.base:
+            rel_path = rel_path[len(self.base) + 1:]
+        for pattern, ignored in reversed(self.dir_groups if is_dir else self.file_groups):
+            if pattern.match(rel_path):
+                return ignored
+        return None
+
+def parse_gitignore_line(line):
+    """
+    Parse one .gitignore line into a (regex, negated, directory only) rule.
+
+    :param line: A line of a .gitignore file.
+    :return: The rule, or None for blank lines and comments.
+    """
+    if not line.endswith("\\ "):
+        line = line.rstrip()
+    if not line or line.startswith("#"):
+        return None
+
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+    dir_only = line.endswith("/")
+    if dir_only:
+        line = line[:-1]
+    # a pattern with a "/" other than a trailing one is relative to the .gitignore directory
+    anchored = "/" in line
+    line = line.lstrip("/")
+    if not line:
+        return None
+    return ("" if anchored else "(?:.*/)?") + translate_gitignore_pattern(line), negated, dir_only
+
+def translate_gitignore_pattern(pattern):
+    """
+    Translate a gitignore glob into a regex: "*" and "?" do not match "/", and "**" matches any number of
+    directories when it is a whole path component.
+
+    :param pattern: The glob, without leading "!", leading "/" or trailing "/".
+    :return: The regex source.
+    """
+    regex = []
+    i, n = 0, len(pattern)
+    while i < n:
+        at_component_start = i == 0 or pattern[i - 1] == "/"
+        if at_component_start and pattern.startswith("**/", i):
+            regex.append("(?:.*/)?")
+            i += 3
+            continue
+        if at_component_start and pattern.startswith("**", i) and i + 2 == n:
+            regex.append(".*")
+            i += 2
+            continue
+
+        char = pattern[i]
+        if char == "*":
+            regex.append("[^/]*")
+        elif char == "?":
+            regex.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                regex.append("\\[")
+            else:
+                chars = pattern[i + 1:end].replace("\\", "\\\\")
+                if chars[0] in "!^":
+                    chars = "^" + chars[1:]
+                regex.append(f"[{chars}]")
+                i = end
+        elif char == "\\" and i + 1 < n:
+            i += 1
+            regex.append(re.escape(pattern[i]))
+        else:
+            regex.append(re.escape(char))
+        i += 1
+    return "".join(regex)
+
+def compile_gitignore_groups(rules):
+    """
+    Combine consecutive rules of the same kind into one compiled regex each.
+
+    :param rules: (regex, negated, directory only) rules in file order.
+    :return: A list of (compiled regex, ignored) groups in file order.
+    """
+    groups = []
+    for regex, negated, _ in rules:
+        if groups and groups[-1][1] == (not negated):
+            groups[-1][0].append(regex)
+        else:
+            groups.append(([regex], not negated))
+    return [(re.compile("(?:" + "|".join(f"(?:{regex})" for regex in regexes) + r")\Z"), ignored)
+            for regexes, ignored in groups]
+
+def is_gitignored(ignores, rel_path, is_dir):
+    """
+    Return True if a path is ignored by the .gitignore files of its directory and its parents.
+
+    :param ignores: The GitIgnore objects applying to the path, outermost first.
+    :param rel_path: The path relative to the walk root, with "/" separators.
+    :param is_dir: Whether the path is a directory.
+    """
+    # the deepest .gitignore with a matching rule decides
+    for ignore in reversed(ignores):
+        ignored = ignore.match(rel_path, is_dir)
+        if ignored is not None:
+            return ignored
+    return False
+
+def is_binary_file(file_path, sniff_size=BINARY_SNIFF_SIZE):
+    """
+    Return True if the first sniff_size bytes of a file contain a NUL byte, the check git uses to detect binaries.
+
+    :param file_path: The path of the file.
+    :param sniff_size: The number of leading bytes to check.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            return b"\0" in f.read(sniff_size)
+    except OSError:
+        return False
+
+class DirectoryScanCache:
+    """
+    Shares the listings of folders between the walks of several projects whose fetch_path overlaps, possibly
+    running at once in several threads: every folder is listed by os.scandir once, by the first walk reaching
+    it, and the other walks reuse its entries. Each walk still applies its own filters to them.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def scan(self, path):
+        """
+        Return the os.DirEntry objects of a folder, listing it on first use. Raises OSError as os.scandir does.
+
+        :param path: The path of the folder.
+        """
+        key = os.path.abspath(path)
+        entries = self._entries.get(key)
+        if entries is not None:
+            return entries
+        with self._lock:
+            folder_lock = self._locks.setdefault(key, threading.Lock())
+        # a walk reaching a folder being listed by another one waits for that listing instead of repeating it
+        with folder_lock:
+            entries = self._entries.get(key)
+            if entries is None:
+                with os.scandir(path) as scandir_it:
+                    entries = self._entries[key] = list(scandir_it)
+        return entries
+
+def walk_files(folder_path, exclude_dirs_list=(), exclude_files_list=(), include_files_extensions=None,
+               exclude_files_extensions=(), respect_gitignore=False, skip_binary_files=False, max_file_size=None,
+               scan_cache=None):
+    """
+    Lazily yields the files under a directory and its subdirectories, in the same order as os.walk.
+
+    Built on os.scandir, so file types come from the cached DirEntry data instead of one stat per entry, and
+    excluded directories are never descended into. All filters are compiled once. Symbolic links to
+    directories are not followed, as with os.walk.
+
     :param folder_path: The root directory to search for files.
-    :param exclude_dirs_list: A list of directory names to exclude from the search.
-    :param exclude_files_list: A list of specific file names to exclude from the search.
-    :param include_files_extensions: A list of file extensions to include (e.g., ['.ts', '.tsx']).
-    :return: A list of filtered files with full paths.
+    :param exclude_dirs_list: Directory names or glob patterns to exclude from the search.
+    :param exclude_files_list: File names or glob patterns to exclude from the search.
+    :param include_files_extensions: File extensions to include, or None to include every extension.
+    :param exclude_files_extensions: File extensions to exclude.
+    :param respect_gitignore: Skip what the .gitignore files found under folder_path ignore, and .git directories.
+                              Ignored directories are not descended into.
+    :param skip_binary_files: Skip files with a NUL byte in their first BINARY_SNIFF_SIZE bytes.
+    :param max_file_size: Skip files larger than this many bytes. None or 0 means no limit.
+    :param scan_cache: Optional DirectoryScanCache the folders are listed through, shared with other walks.
+    :return: A generator of file paths.
     """
-    filtered_files = []
-    
-    for path, subdirs, files in os.walk(folder_path):
-        # Exclude directories specified in exclude_dirs_list
-        subdirs[:] = [d for d in subdirs if d not in exclude_dirs_list]  # Modify subdirs in place
+    exclude_dirs = NameFilter(exclude_dirs_list)
+    exclude_files = NameFilter(exclude_files_list, exclude_files_extensions)
+    include_files = NameFilter(extensions=include_files_extensions) if include_files_extensions is not None else None
 
-        # Filter files based on the include_files_extensions and exclude_files_list
-        for file in files:
-            file_path = os.path.join(path, file)
+    # depth-first stack of (directory, path relative to folder_path, applying .gitignore files) still to scan
+    stack = [(folder_path, "", ())]
+    while stack:
+        path, rel_path, ignores = stack.pop()
+        try:
+            if scan_cache is None:
+                with os.scandir(path) as scandir_it:
+                    entries = list(scandir_it)
+            else:
+                entries = scan_cache.scan(path)
+        except OSError:
+            continue
+
+        if respect_gitignore:
+            for entry in entries:
+                if entry.name == ".gitignore":
+                    try:
+                        ignores = ignores + (GitIgnore.from_file(entry.path, rel_path),)
+                    except OSError:
+                        pass
+                    break
+
+        subdirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+
+            name = entry.name
+            # entries shared by a scan cache may come from a walk spelling the folder differently
+            entry_path = entry.path if scan_cache is None else os.path.join(path, name)
+            entry_rel_path = f"{rel_path}/{name}" if rel_path else name
+            if is_dir:
+                if exclude_dirs.matches_name(name) or entry.is_symlink():
+                    continue
+                if respect_gitignore and (name == ".git" or is_gitignored(ignores, entry_rel_path, True)):
+                    continue
+                subdirs.append((entry_path, entry_rel_path, ignores))
+                continue
 
-            # Skip if the file is in the exclude_files_list
-            if file in exclude_files_list:
+            if exclude_files.matches_name(name) or exclude_files.matches_extension(name):
+                continue
+            if include_files is not None and not include_files.matches_extension(name):
+                continue
+            if respect_gitignore and is_gitignored(ignores, entry_rel_path, False):
                 continue
+            if max_file_size:
+                try:
+                    if entry.stat().st_size > max_file_size:
+                        continue
+                except OSError:
+                    pass
+            if skip_binary_files and is_binary_file(entry_path):
+                continue
+            yield entry_path
+
+        # scan subdirectories in listing order, each one fully before the next as os.walk does
+        stack.extend(reversed(subdirs))
+
+def iter_files_with_extensions(folder_path, exclude_dirs_list=[], exclude_files_list=[], include_files_extensions=[],
+                               respect_gitignore=False, skip_binary_files=False, max_file_size=None, scan_cache=None):
+    """
+    Lazily yields the files of list_files_with_extensions, as they are found.
 
-            # Include files with the specified extensions only
-            if include_files_extensions and any(file.endswith(ext) for ext in include_files_extensions):
-                filtered_files.append(file_path)
+    :param folder_path: The root directory to search for files.
+    :param exclude_dirs_list: A list of directory names (or glob patterns) to exclude from the search.
+    :param exclude_files_list: A list of specific file names (or glob patterns) to exclude from the search.
+    :param include_files_extensions: A list of file extensions to include (e.g., ['.ts', '.tsx']).
+    :param respect_gitignore: Skip files and directories ignored by .gitignore files, see walk_files.
+    :param skip_binary_files: Skip files that look binary, see walk_files.
+    :param max_file_size: Skip files larger than this many bytes. None or 0 means no limit.
+    :param scan_cache: Optional DirectoryScanCache shared with other walks, see walk_files.
+    :return: A generator of file paths.
+    """
+    # no extensions to include means no file is included
+    if include_files_extensions:
+        yield from walk_files(folder_path, exclude_dirs_list, exclude_files_list, include_files_extensions,
+                              respect_gitignore=respect_gitignore, skip_binary_files=skip_binary_files,
+                              max_file_size=max_file_size, scan_cache=scan_cache)
+
+def list_files_with_extensions(folder_path, exclude_dirs_list=[], exclude_files_list=[], include_files_extensions=[]):
+    """
+    Lists files from a directory and its subdirectories, including only the specified file extensions.
     
-    return filtered_files
+    :param folder_path: The root directory to search for files.
+    :param exclude_dirs_list: A list of directory names (or glob patterns) to exclude from the search.
+    :param exclude_files_list: A list of specific file names (or glob patterns) to exclude from the search.
+    :param include_files_extensions: A list of file extensions to include (e.g., ['.ts', '.tsx']).
+    :return: A list of filtered files with full paths.
+    """
+    return list(iter_files_with_extensions(folder_path, exclude_dirs_list, exclude_files_list, include_files_extensions))
 
 def split_list_into_chunks(input_list: List[Any], chunk_size: int = 4) -> List[List[Any]]:
     """
@@ -116,6 +1339,16 @@ def split_list_into_chunks(input_list: List[Any], chunk_size: int = 4) -> List[L
     # Using list comprehension to break the input_list into chunks of size chunk_size
     return [input_list[i:i + chunk_size] for i in range(0, len(input_list), chunk_size)]
 
+def get_display_path(file_path, root_dir_name = "src"):
+    """
+    Get the path of a file as shown in the export headers: its folder from [root_dir_name] and its name.
+
+    :param file_path: Full file path as input.
+    :param root_dir_name: The directory from which the shown path starts.
+    :return: The path shown in the header.
+    """
+    return os.path.join(get_folder_path_from_root(file_path, root_dir_name), os.path.basename(file_path))
+
 def get_folder_path_from_root(file_path, root_dir_name = "src"):
     """
     Get the folder path after the [root_dir_name] directory from the complete file path.
@@ -164,10 +1397,7 @@ def read_file_to_lines(file_name, folder_path=None):
     file_path = os.path.join(folder_path, file_name) if folder_path else file_name
     
     try:
-        # Using 'with' ensures the file is properly closed after reading
-        with open(file_path, "r", errors='ignore') as file_obj:
-            lines = file_obj.readlines()  # Read all lines from the file into a list
-        return lines
+        return io_extender.read_file_to_lines(file_path, errors='ignore')
     except FileNotFoundError:
         print(f"Error: File '{file_name}' not found at '{file_path}'")
         return []
@@ -175,6 +1405,58 @@ def read_file_to_lines(file_name, folder_path=None):
         print(f"Error reading file '{file_name}': {e}")
         return []
 
+def read_file_content(file_path):
+    """
+    Read the whole content of a file as one string, decoded like read_file_to_lines does.
+
+    :param file_path: The path of the file to read.
+    :return: The content of the file, or an empty string if it could not be read.
+    """
+    try:
+        return io_extender.read_text(file_path, errors='ignore')
+    except FileNotFoundError:
+        print(f"Error: File '{os.path.basename(file_path)}' not found at '{file_path}'")
+        return ''
+    except IOError as e:
+        print(f"Error reading file '{os.path.basename(file_path)}': {e}")
+        return ''
+
+def read_files_ordered(files, workers, read_ahead=None):
+    """
+    Read files in a thread pool and yield (file, content) in the order of the input list.
+
+    Only a bounded number of files is submitted ahead of the one being yielded, so memory holds at most
+    read_ahead files at once however long the list is, and a slow file only stalls the output until it is read.
+
+    :param files: The list of file paths to read, e.g. as returned by list_files_with_extensions.
+    :param workers: The number of reading threads.
+    :param read_ahead: The maximum number of files read but not yet yielded. Defaults to
+                       READ_AHEAD_PER_WORKER files per worker.
+    :return: A generator of (file path, content) tuples.
+    """
+    if not isinstance(workers, int) or workers <= 0:
+        raise ValueError("workers must be a positive integer.")
+    read_ahead = read_ahead or workers * READ_AHEAD_PER_WORKER
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # reorder buffer: futures of the files in input order, the oldest one is yielded first
+        pending = deque()
+        files = iter(files)
+        for file in files:
+            pending.append((file, executor.submit(read_file_content, file)))
+            if len(pending) >= read_ahead:
+                break
+        while pending:
+            file, future = pending.popleft()
+            next_file = next(files, None)
+            if next_file is not None:
+                pending.append((next_file, executor.submit(read_file_content, next_file)))
+            yield file, future.result()
+
+def content_length(item):
+    """Return the length of the content of a (file, content) tuple, as counted by the read stage."""
+    return len(item[1])
+
 def write_to_file_from_str(var_str, file_name, file_path=None):
     """
     Write a string to a file.
@@ -236,32 +1518,13 @@ def list_files_excluding_extensions(folder_path, exclude_dirs_list=[], exclude_f
     Lists files from a directory and its subdirectories, excluding specified file extensions.
     
     :param folder_path: The root directory to search for files.
-    :param exclude_dirs_list: A list of directory names to exclude from the search.
-    :param exclude_files_list: A list of specific file names to exclude from the search.
+    :param exclude_dirs_list: A list of directory names (or glob patterns) to exclude from the search.
+    :param exclude_files_list: A list of specific file names (or glob patterns) to exclude from the search.
     :param exclude_files_extensions: A list of file extensions to exclude (e.g., ['.ts', '.tsx']).
     :return: A list of filtered files with full paths.
     """
-    filtered_files = []
-    
-    for path, subdirs, files in os.walk(folder_path):
-        # Exclude directories specified in exclude_dirs_list
-        subdirs[:] = [d for d in subdirs if d not in exclude_dirs_list]  # Modify subdirs in place
-
-        # Filter files based on the exclude_files_extensions and exclude_files_list
-        for file in files:
-            file_path = os.path.join(path, file)
-
-            # Skip if the file is in the exclude_files_list
-            if file in exclude_files_list:
-                continue
-
-            # Skip files with the specified extensions to exclude
-            if exclude_files_extensions and any(file.endswith(ext) for ext in exclude_files_extensions):
-                continue
-
-            filtered_files.append(file_path)
-    
-    return filtered_files
+    return list(walk_files(folder_path, exclude_dirs_list, exclude_files_list,
+                           exclude_files_extensions=exclude_files_extensions))
 
 def get_parent_folder_name(file_path):
     """
@@ -286,8 +1549,9 @@ def remove_empty_lines(lines):
         print("Warning: Input is not a list. Returning an empty list.")
         return []
 
-    # List comprehension that filters out lines that are empty or contain only whitespace
-    return [line for line in lines if line.strip()]
+    # Keep only the lines that contain something other than whitespace
+    return io_extender.remove_empty_lines(lines)
 
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
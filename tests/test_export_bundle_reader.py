@@ -0,0 +1,56 @@
+"""
+Tests of export_bundle_reader.BundleReader.grep on a bundle written by extract_files_to_text.ExportWriter.
+
+Usage:
+    python -m unittest discover tests
+"""
+
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export_bundle_reader import BundleReader
+from extract_files_to_text import ExportWriter, bundle_index_path
+
+
+class GrepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        bundle_path = os.path.join(self.tmp_dir.name, "out_v1_file.log")
+        with ExportWriter(bundle_path) as writer:
+            writer.write_header("src/a.py")
+            writer.write_content("import os\nx = 1  # import\n")
+            writer.write_header("src/b.py")
+            writer.write_content("y = 2\nimport sys\n")
+        self.reader = BundleReader(bundle_index_path(bundle_path))
+
+    def tearDown(self):
+        self.reader.close()
+        self.tmp_dir.cleanup()
+
+    def grep(self, pattern, flags=0):
+        return [(entry["path"], line_number, line)
+                for entry, line_number, line in self.reader.grep(re.compile(pattern, flags))]
+
+    def test_unanchored_pattern_matches_anywhere_in_a_line(self):
+        self.assertEqual(self.grep(rb"import"), [("src/a.py", 1, b"import os"), ("src/a.py", 2, b"x = 1  # import"),
+                                                 ("src/b.py", 2, b"import sys")])
+
+    def test_caret_matches_at_the_start_of_every_line(self):
+        self.assertEqual(self.grep(rb"^import"), [("src/a.py", 1, b"import os"), ("src/b.py", 2, b"import sys")])
+
+    def test_dollar_matches_at_the_end_of_every_line(self):
+        self.assertEqual(self.grep(rb"= \d$"), [("src/b.py", 1, b"y = 2")])
+
+    def test_anchors_keep_the_flags_of_the_pattern(self):
+        self.assertEqual(self.grep(rb"^IMPORT", re.IGNORECASE),
+                         [("src/a.py", 1, b"import os"), ("src/b.py", 2, b"import sys")])
+
+
+if __name__ == "__main__":
+    unittest.main()